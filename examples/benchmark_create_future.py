@@ -0,0 +1,72 @@
+###############################################################################
+#
+# The MIT License (MIT)
+#
+# Copyright (c) Crossbar.io Technologies GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+"""
+Micro-benchmark for creating already-completed futures, e.g. when
+returning a known result from a hot handler. Run it as:
+
+    python benchmark_create_future.py twisted
+    python benchmark_create_future.py asyncio
+"""
+
+from __future__ import print_function
+
+import sys
+import timeit
+
+import txaio
+
+if len(sys.argv) > 1 and sys.argv[1] == 'twisted':
+    txaio.use_twisted()
+else:
+    txaio.use_asyncio()
+
+number = 200000
+error = RuntimeError("sadness")
+txa = txaio.with_config()
+
+
+def general_success():
+    txaio.create_future(result=42)
+
+
+def fast_success():
+    txaio.create_future_success(42)
+
+
+def fast_success_with_config():
+    txa.create_future_success(42)
+
+
+def fast_error():
+    f = txaio.create_future_error(error)
+    # (don't leave unhandled errors around)
+    txaio.add_callbacks(f, None, lambda fail: None)
+
+
+for fn in (general_success, fast_success, fast_success_with_config, fast_error):
+    best = min(timeit.repeat(fn, number=number, repeat=5))
+    print("{:>26}: {:.3f} usec/future".format(fn.__name__, best * 1e6 / number))
@@ -24,6 +24,8 @@
 #
 ###############################################################################
 
+import sys
+
 import pytest
 import txaio
 
@@ -185,3 +187,101 @@ def test_as_future_recursive(framework):
     assert len(errors) == 0
     assert results[0] == 42
     assert calls[0] == ((1, 2, 3), dict(key='word'))
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason="needs async def")
+def test_as_future_eager(framework_aio):
+    '''
+    with eager coroutines, a coroutine that doesn't suspend gives a
+    completed Future (and no Task); one that does carries on in a Task
+    '''
+    import asyncio
+    namespace = dict(
+        asyncio=asyncio,
+        # (python 3.7+; Task.current_task before that)
+        current_task=getattr(asyncio, 'current_task', None) or asyncio.Task.current_task,
+    )
+    exec('''
+async def cached(x):
+    return x * 2
+
+async def fetch(x):
+    await asyncio.sleep(0)
+    return x * 3
+
+async def broken():
+    raise RuntimeError("sadness")
+
+async def whoami():
+    me = current_task()
+    await asyncio.sleep(0)
+    return me, current_task()
+
+async def driver(txa, seen):
+    seen.append(current_task())
+    seen.append(await txa.as_future(whoami))
+    seen.append(current_task())
+''', namespace)
+    loop = asyncio.new_event_loop()
+    try:
+        txa = txaio.with_config(loop=loop, eager_coroutines=True)
+
+        f = txa.as_future(namespace['cached'], 21)
+        assert not isinstance(f, asyncio.Task)
+        assert f.done() and f.result() == 42
+
+        f = txaio.as_future_eager(namespace['broken'])
+        assert f.done() and isinstance(f.exception(), RuntimeError)
+
+        f = txa.as_future(namespace['fetch'], 14)
+        assert isinstance(f, asyncio.Task)
+        assert loop.run_until_complete(f) == 42
+
+        # cancelled before it carried on
+        f = txa.as_future(namespace['fetch'], 14)
+        f.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            loop.run_until_complete(f)
+
+        # the first step isn't in a Task yet (but isn't in the
+        # caller's either, where we can tell); the rest is in its own
+        seen = []
+        loop.run_until_complete(namespace['driver'](txa, seen))
+        caller, (first, rest), after = seen
+        if sys.version_info >= (3, 7):
+            assert first is None
+        assert rest is not None and rest is not caller
+        assert after is caller
+
+        # the default is still to create a Task
+        f = txaio.with_config(loop=loop).as_future(namespace['cached'], 1)
+        assert isinstance(f, asyncio.Task)
+        assert loop.run_until_complete(f) == 2
+    finally:
+        loop.close()
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason="needs contextvars")
+def test_as_future_eager_context(framework_aio):
+    '''
+    an eager coroutine runs in its own context, before and after it
+    first suspends
+    '''
+    import asyncio
+    import contextvars
+    var = contextvars.ContextVar('var', default='caller')
+    namespace = dict(asyncio=asyncio, var=var)
+    exec('''
+async def setter():
+    var.set('coroutine')
+    await asyncio.sleep(0)
+    return var.get()
+''', namespace)
+    loop = asyncio.new_event_loop()
+    try:
+        txa = txaio.with_config(loop=loop, eager_coroutines=True)
+        f = txa.as_future(namespace['setter'])
+        assert var.get() == 'caller'
+        assert loop.run_until_complete(f) == 'coroutine'
+    finally:
+        loop.close()
@@ -167,3 +167,153 @@ def test_batched_cancel_too_late(framework_aio):
         new_loop.advance_time(1)
         new_loop._run_once()
         assert len(calls) == 1
+
+
+def test_wheel_successful_call(framework_aio):
+    '''
+    the timing-wheel engine works with asyncio too
+    '''
+    # Trollius doesn't come with this, so won't work on py2
+    pytest.importorskip('asyncio.test_utils')
+    from asyncio.test_utils import TestLoop
+
+    def time_gen():
+        yield
+        yield
+        yield
+    new_loop = TestLoop(time_gen)
+    calls = []
+    with replace_loop(new_loop):
+        batched = txaio.make_batched_timer(5, engine='wheel')
+
+        batched.call_later(5.1, calls.append, "first call")
+        batched.call_later(9.9, calls.append, "second call")
+        batched.call_later(10.1, calls.append, "third call")
+        # three calls in two buckets, but one underlying timer
+        assert len(new_loop._scheduled) == 1
+
+        new_loop.advance_time(4.9)
+        new_loop._run_once()
+        assert calls == []
+
+        new_loop.advance_time(0.2)
+        new_loop._run_once()
+        assert calls == ["first call", "second call"]
+
+        new_loop.advance_time(5)
+        new_loop._run_once()
+        assert calls == ["first call", "second call", "third call"]
+
+
+def test_batched_sleep(framework_aio):
+    '''
+    sleep() returns Futures (and no Tasks) sharing the timer's buckets
+    '''
+    # Trollius doesn't come with this, so won't work on py2
+    pytest.importorskip('asyncio.test_utils')
+    from asyncio.test_utils import TestLoop
+
+    def time_gen():
+        yield
+        yield
+        yield
+    new_loop = TestLoop(time_gen)
+    with replace_loop(new_loop):
+        batched = txaio.make_batched_timer(5)
+        sleeps = [batched.sleep(5) for _ in range(10)]
+        cancelled = batched.sleep(5)
+        assert len(new_loop._scheduled) == 1
+
+        cancelled.cancel()
+        new_loop._run_once()
+        assert batched.stats()['cancelled'] == 1
+
+        new_loop.advance_time(5)
+        new_loop._run_once()
+        assert all(f.done() and f.result() is None for f in sleeps)
+        assert cancelled.cancelled()
+
+
+def test_batched_drain(framework_aio):
+    '''
+    drain() resolves its Future once every pending call is done
+    '''
+    pytest.importorskip('asyncio.test_utils')
+    from asyncio.test_utils import TestLoop
+
+    def time_gen():
+        yield
+        yield
+    new_loop = TestLoop(time_gen)
+    calls = []
+    with replace_loop(new_loop):
+        batched = txaio.make_batched_timer(5)
+        for n in range(10):
+            batched.call_later(5 + n, calls.append, n)
+        f = batched.drain()
+        assert calls == list(range(10))
+        assert f.done()
+        assert not [h for h in new_loop._scheduled if not h._cancelled]
+
+
+def test_batched_drain_errors(framework_aio):
+    '''
+    errors from drain()'s calls fail its Future, rather than being
+    raised from drain() itself
+    '''
+    pytest.importorskip('asyncio.test_utils')
+    from asyncio.test_utils import TestLoop
+
+    def time_gen():
+        yield
+        yield
+    new_loop = TestLoop(time_gen)
+
+    def boom():
+        raise ValueError("boom")
+
+    with replace_loop(new_loop):
+        batched = txaio.make_batched_timer(5)
+        batched.call_later(5, boom)
+        f = batched.drain()
+        assert f.done()
+        assert isinstance(f.exception(), RuntimeError)
+        assert 'boom' in str(f.exception())
+
+
+def test_sharded_threadsafe(framework_aio):
+    '''
+    worker threads can schedule calls on each loop's timer
+    '''
+    import threading
+    asyncio = pytest.importorskip('asyncio')
+
+    loops = [asyncio.new_event_loop() for _ in range(2)]
+    sharded = txaio.make_sharded_batched_timer(0.01)
+    results = dict((loop, []) for loop in loops)
+    done = dict((loop, asyncio.Future(loop=loop)) for loop in loops)
+
+    def fired(loop, n):
+        results[loop].append((n, threading.current_thread()))
+        if len(results[loop]) == 50:
+            done[loop].set_result(None)
+
+    def producer(loop):
+        timer = sharded.for_loop(loop)
+        for n in range(50):
+            timer.call_later(0.01, fired, loop, n)
+
+    try:
+        assert sharded.for_loop(loops[0]) is not sharded.for_loop(loops[1])
+        threads = [threading.Thread(target=producer, args=(loop, )) for loop in loops]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for loop in loops:
+            loop.run_until_complete(asyncio.wait_for(done[loop], 5, loop=loop))
+            assert sorted(n for (n, _) in results[loop]) == list(range(50))
+            assert all(t is threading.current_thread() for (_, t) in results[loop])
+    finally:
+        for loop in loops:
+            loop.close()
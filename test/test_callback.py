@@ -71,3 +71,91 @@ def test_immediate_result(framework):
 
     assert len(results) == 1
     assert results[0] == "it worked"
+
+
+def test_callback_chain(framework):
+    '''
+    callbacks form a chain, each getting the previous one's result
+    '''
+    f = txaio.create_future()
+    results = []
+
+    def fail(x):
+        raise RuntimeError("sadness {}".format(x))
+
+    def recover(fail):
+        results.append(txaio.failure_message(fail))
+        return 'recovered'
+
+    def pass_failure(fail):
+        return fail
+
+    assert txaio.add_callbacks(f, lambda x: x + 1, None) is f
+    txaio.add_callbacks(
+        txaio.add_callbacks(f, lambda x: x * 2, None),
+        fail, None,
+    )
+    txaio.add_callbacks(f, results.append, pass_failure)
+    txaio.add_callbacks(f, results.append, recover)
+    txaio.add_callbacks(f, lambda x: results.append(x) or x, None)
+    txaio.resolve(f, 1)
+
+    run_once()
+
+    assert results == ['RuntimeError: sadness 4', 'recovered']
+
+    # more callbacks carry on from where the chain got to
+    txaio.add_callbacks(f, lambda x: results.append(x.upper()), None)
+    run_once()
+    assert results[-1] == 'RECOVERED'
+
+
+def test_callback_chain_future(framework):
+    '''
+    a callback returning a future pauses the chain until it is done
+    '''
+    f = txaio.create_future()
+    inner = txaio.create_future()
+    results = []
+
+    txaio.add_callbacks(f, lambda _: inner, None)
+    txaio.add_callbacks(f, results.append, None)
+    txaio.resolve(f, 'outer')
+    run_once()
+    assert results == []
+
+    txaio.resolve(inner, 'inner')
+    run_once()
+    assert results == ['inner']
+
+
+def test_callback_chain_added_later(framework):
+    '''
+    stages added while the chain runs, or waits for a future one of
+    them returned, carry on in order
+    '''
+    f = txaio.create_future()
+    inner = txaio.create_future()
+    results = []
+
+    def first(x):
+        txaio.add_callbacks(f, lambda y: results.append(('added', y)), None)
+        return x + 1
+
+    txaio.add_callbacks(f, first, None)
+    txaio.add_callbacks(f, lambda x: results.append(x) or inner, None)
+    txaio.resolve(f, 1)
+    run_once()
+    assert results == [2]
+
+    # (waiting for inner now)
+    txaio.add_callbacks(f, lambda x: results.append(x) or 'a', None)
+    txaio.add_callbacks(f, lambda x: results.append(x) or 'b', None)
+    txaio.resolve(inner, 'inner')
+    run_once()
+    # ('added' went on the end, after the one returning inner)
+    assert results == [2, ('added', 'inner'), None, 'a']
+
+    txaio.add_callbacks(f, results.append, None)
+    run_once()
+    assert results[-1] == 'b'
@@ -1,5 +1,7 @@
 import txaio
 
+from util import run_once
+
 
 def test_illegal_args(framework):
     try:
@@ -25,3 +27,116 @@ def test_create_error(framework):
         assert f.done()
     # cancel the error; we expected it
     txaio.add_callbacks(f, None, lambda _: None)
+
+
+def test_create_success_and_error(framework):
+    f = txaio.create_future_success('foo')
+    results = []
+    txaio.add_callbacks(f, results.append, None)
+    errors = []
+    e = RuntimeError("test")
+    f = txaio.create_future_error(e)
+    txaio.add_callbacks(f, None, errors.append)
+    run_once()
+    assert results == ['foo']
+    assert len(errors) == 1 and errors[0].value is e
+
+
+def test_as_future_explicit_loop(framework_aio):
+    '''
+    as_future (and create_future) on a with_config() instance use its loop
+    '''
+    import asyncio
+    alt_loop = asyncio.new_event_loop()
+    try:
+        txa = txaio.with_config(loop=alt_loop)
+        for f in (txa.as_future(lambda: 42), txa.create_future(result=42)):
+            assert f._loop is alt_loop
+    finally:
+        alt_loop.close()
+
+
+def test_resolve_threadsafe(framework_aio):
+    '''
+    a worker thread settling many futures wakes the loop up once per
+    batch, not once per future
+    '''
+    import asyncio
+    import threading
+    loop = asyncio.new_event_loop()
+    wakeups = []
+    real_wakeup = loop.call_soon_threadsafe
+
+    def counting_wakeup(*args):
+        wakeups.append(args)
+        return real_wakeup(*args)
+    loop.call_soon_threadsafe = counting_wakeup
+
+    try:
+        txa = txaio.with_config(loop=loop)
+        futures = [txa.create_future() for _ in range(100)]
+
+        def worker():
+            for n, f in enumerate(futures[:-1]):
+                txa.resolve_threadsafe(f, n)
+            try:
+                raise RuntimeError("sadness")
+            except RuntimeError:
+                txa.reject_threadsafe(futures[-1])
+
+        t = threading.Thread(target=worker)
+        t.start()
+        t.join()
+        assert len(wakeups) == 1
+        assert not any(f.done() for f in futures)
+
+        loop.run_until_complete(asyncio.wait(futures, loop=loop))
+        assert [f.result() for f in futures[:-1]] == list(range(99))
+        assert isinstance(futures[-1].exception(), RuntimeError)
+
+        # on the loop's thread, it happens right away
+        f = txa.create_future()
+        txa.resolve_threadsafe(f, 'now')
+        assert f.result() == 'now'
+    finally:
+        loop.close()
+
+
+def test_resolve_threadsafe_tx(framework_tx):
+    '''
+    on Twisted, the reactor gets one callFromThread() per batch
+    '''
+    import threading
+
+    class FakeReactor(object):
+        def __init__(self):
+            self.calls = []
+
+        def callFromThread(self, func, *args):
+            self.calls.append((func, args))
+
+    old_loop = txaio.config.loop
+    txaio.config.loop = reactor = FakeReactor()
+    try:
+        futures = [txaio.create_future() for _ in range(10)]
+        results = []
+        errors = []
+        for f in futures:
+            txaio.add_callbacks(f, results.append, errors.append)
+
+        def worker():
+            for f in futures[:-1]:
+                txaio.resolve_threadsafe(f, 'ok')
+            txaio.reject_threadsafe(futures[-1], RuntimeError("sadness"))
+
+        t = threading.Thread(target=worker)
+        t.start()
+        t.join()
+        assert len(reactor.calls) == 1 and not results
+
+        func, args = reactor.calls[0]
+        func(*args)
+        assert results == ['ok'] * 9
+        assert len(errors) == 1
+    finally:
+        txaio.config.loop = old_loop
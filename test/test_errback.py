@@ -24,6 +24,8 @@
 #
 ###############################################################################
 
+import six
+
 import txaio
 
 from util import run_once
@@ -184,3 +186,86 @@ def test_immediate_failure(framework):
     assert errors[1].value == exception
     # should be distinct FailedPromise instances
     assert id(errors[0]) != id(errors[1])
+
+
+def _broken():
+    raise RuntimeError("it failed")
+
+
+def test_compact_failure(framework):
+    '''
+    a compact failure doesn't keep the traceback, but can still format
+    one
+    '''
+    try:
+        _broken()
+    except RuntimeError:
+        fail = txaio.create_failure(compact=True)
+
+    assert getattr(fail.value, '__traceback__', None) is None
+    assert fail.value.args == ("it failed",)
+    assert txaio.failure_traceback(fail) is None
+    assert txaio.failure_message(fail) == 'RuntimeError: it failed'
+    tb = txaio.failure_format_traceback(fail)
+    assert '_broken' in tb
+    assert 'RuntimeError: it failed' in tb
+
+    if txaio.using_asyncio:
+        assert not hasattr(fail, '__dict__')
+
+    # the config decides, unless told otherwise
+    txaio.config.compact_failures = True
+    try:
+        try:
+            _broken()
+        except RuntimeError:
+            compact = txaio.create_failure()
+            full = txaio.create_failure(compact=False)
+    finally:
+        txaio.config.compact_failures = False
+    assert txaio.failure_traceback(compact) is None
+    assert txaio.failure_traceback(full) is not None
+
+
+def test_compact_failure_live_exception(framework):
+    '''
+    a compact failure leaves the exception being handled alone (it can
+    still be re-raised, or made into another failure) and doesn't keep
+    the exceptions it was chained to
+    '''
+    try:
+        try:
+            _broken()
+        except RuntimeError:
+            raise ValueError("while handling")
+    except ValueError as e:
+        compact = txaio.create_failure(compact=True)
+        full = txaio.create_failure(compact=False)
+        if six.PY3:
+            assert e.__traceback__ is not None
+            assert compact.value is not e
+    assert txaio.failure_traceback(full) is not None
+    assert getattr(compact.value, '__traceback__', None) is None
+    assert getattr(compact.value, '__context__', None) is None
+    assert txaio.failure_message(compact) == 'ValueError: while handling'
+    tb = txaio.failure_format_traceback(compact)
+    assert 'while handling' in tb
+    if six.PY3 and txaio.using_asyncio:
+        # ...but can still format them
+        assert 'it failed' in tb
+
+
+def test_compact_failure_chain(framework_aio):
+    '''
+    errbacks added via a compact_failures instance get compact failures
+    '''
+    txa = txaio.with_config(compact_failures=True)
+    f = txa.create_future()
+    errors = []
+    txa.add_callbacks(f, None, errors.append)
+    txa.reject(f, RuntimeError("it failed"))
+    run_once()
+
+    assert len(errors) == 1
+    assert txaio.failure_message(errors[0]) == 'RuntimeError: it failed'
+    assert txaio.failure_traceback(errors[0]) is None
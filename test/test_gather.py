@@ -24,9 +24,13 @@
 #
 ###############################################################################
 
+import sys
+
+import pytest
+
 import txaio
 
-from util import await
+from util import await, run_once
 
 
 def test_gather_two(framework):
@@ -106,3 +110,279 @@ def test_gather_no_consume(framework):
     assert len(results) == 0
     assert len(errors) == 3
     assert len(calls) == 0
+
+
+def test_map_concurrent(framework):
+    '''
+    at most `limit` calls run at once, items are taken lazily and the
+    results are in input order
+    '''
+    pending = []
+    taken = []
+    results = []
+
+    def items():
+        for n in range(10):
+            taken.append(n)
+            yield n
+
+    def fn(n):
+        f = txaio.create_future()
+        pending.append((n, f))
+        return f
+
+    f = txaio.map_concurrent(fn, items(), limit=3)
+    txaio.add_callbacks(f, results.append, None)
+    assert len(pending) == 3
+    assert taken == [0, 1, 2]
+
+    while pending:
+        # finish them in reverse order
+        n, p = pending.pop()
+        if n == 4:
+            txaio.reject(p, RuntimeError("sadness"))
+        else:
+            txaio.resolve(p, n * 10)
+        for _ in range(3):
+            run_once()
+        assert len(pending) <= 3
+
+    assert len(results) == 1
+    values = results[0]
+    assert [v for v in values if not isinstance(v, txaio.IFailedFuture)] == \
+        [0, 10, 20, 30, 50, 60, 70, 80, 90]
+    assert isinstance(values[4], txaio.IFailedFuture)
+
+
+def test_map_concurrent_sync(framework):
+    '''
+    functions that return right away don't make us recurse
+    '''
+    results = []
+    errors = []
+    f = txaio.map_concurrent(lambda n: n + 1, range(5000), limit=4)
+    txaio.add_callbacks(f, results.append, errors.append)
+    # (with asyncio, each round of callbacks needs a loop iteration)
+    for _ in range(5000):
+        if results or errors:
+            break
+        run_once()
+    assert errors == []
+    assert results[0] == list(range(1, 5001))
+
+
+def test_map_concurrent_cancel(framework):
+    '''
+    cancelling the returned future stops the map, and cancels the
+    calls still running
+    '''
+    pending = []
+    taken = []
+    errors = []
+
+    def items():
+        for n in range(100):
+            taken.append(n)
+            yield n
+
+    def fn(n):
+        f = txaio.create_future()
+        pending.append(f)
+        return f
+
+    f = txaio.map_concurrent(fn, items(), limit=3)
+
+    def cancelled(fail):
+        errors.append(fail)
+        return None
+    txaio.add_callbacks(f, None, cancelled)
+    assert taken == [0, 1, 2]
+
+    f.cancel()
+    for _ in range(5):
+        run_once()
+
+    assert len(errors) == 1
+    assert taken == [0, 1, 2]
+    assert len(pending) == 3
+    # (cancelled, so done, on both frameworks)
+    assert all(txaio.is_called(p) for p in pending)
+
+
+def test_gather_limit_no_consume(framework):
+    '''
+    gather(limit=) takes futures lazily; without consume_exceptions the
+    first failure fails it
+    '''
+    made = []
+    errors = []
+
+    def futures():
+        for n in range(100):
+            made.append(n)
+            if n == 2:
+                yield txaio.create_future_error(RuntimeError("sadness"))
+            else:
+                yield txaio.create_future()
+
+    f = txaio.gather(futures(), consume_exceptions=False, limit=5)
+    txaio.add_callbacks(f, None, errors.append)
+    for _ in range(3):
+        run_once()
+    assert len(errors) == 1
+    assert str(errors[0].value) == "sadness"
+    assert len(made) <= 6
+
+
+def test_gather_limit_no_consume_handled(framework):
+    '''
+    without consume_exceptions, the failure goes to gather()'s future
+    and isn't left unhandled in the one that failed
+    '''
+    bad = txaio.create_future_error(RuntimeError("sadness"))
+    errors = []
+    after = []
+
+    f = txaio.gather([bad], consume_exceptions=False, limit=5)
+    txaio.add_callbacks(f, None, errors.append)
+    txaio.add_callbacks(bad, after.append, after.append)
+    for _ in range(3):
+        run_once()
+    assert len(errors) == 1
+    assert after == [None]
+
+
+def test_as_completed(framework):
+    '''
+    the futures we iterate over get the outcomes in completion order
+    '''
+    sources = [txaio.create_future() for _ in range(3)]
+    results = []
+    errors = []
+
+    completed = txaio.as_completed(sources)
+    first = next(completed)
+    txaio.add_callbacks(first, results.append, errors.append)
+
+    txaio.resolve(sources[2], 'two')
+    run_once()
+    run_once()
+    assert results == ['two']
+
+    txaio.reject(sources[0], RuntimeError("sadness"))
+    txaio.resolve(sources[1], 'one')
+    run_once()
+    run_once()
+    # these were already done when we asked for them
+    for f in completed:
+        txaio.add_callbacks(f, results.append, errors.append)
+    run_once()
+    run_once()
+
+    assert results == ['two', 'one']
+    assert len(errors) == 1
+    assert txaio.failure_message(errors[0]) == 'RuntimeError: sadness'
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason="needs async def")
+def test_as_completed_async_for(framework_aio):
+    '''
+    with async for, failures are given (not raised) as they arrive
+    '''
+    import asyncio
+    namespace = {}
+    exec('''
+async def consume(completed):
+    got = []
+    async for outcome in completed:
+        got.append(outcome)
+    return got
+''', namespace)
+    loop = asyncio.new_event_loop()
+    try:
+        txa = txaio.with_config(loop=loop)
+        sources = [txa.create_future() for _ in range(3)]
+        loop.call_later(0.02, txa.resolve, sources[0], 'slow')
+        loop.call_later(0.01, txa.reject, sources[1], RuntimeError("sadness"))
+        txa.resolve(sources[2], 'fast')
+
+        got = loop.run_until_complete(
+            namespace['consume'](txa.as_completed(sources))
+        )
+        assert got[0] == 'fast'
+        assert isinstance(got[1], txaio.IFailedFuture)
+        assert got[2] == 'slow'
+    finally:
+        loop.close()
+
+
+def test_race(framework):
+    '''
+    the first success wins (failures before it don't count) and the
+    others are cancelled
+    '''
+    sources = [txaio.create_future() for _ in range(3)]
+    results = []
+
+    f = txaio.race(sources)
+    txaio.add_callbacks(f, results.append, None)
+    txaio.reject(sources[0], RuntimeError("sadness"))
+    run_once()
+    txaio.resolve(sources[2], 'winner')
+    run_once()
+    run_once()
+
+    assert results == ['winner']
+    assert txaio.is_called(sources[1])
+    if txaio.using_asyncio:
+        assert sources[1].cancelled()
+
+
+def test_race_all_fail(framework):
+    sources = [txaio.create_future() for _ in range(2)]
+    errors = []
+
+    f = txaio.race(sources)
+    txaio.add_callbacks(f, None, errors.append)
+    txaio.reject(sources[1], RuntimeError("first"))
+    txaio.reject(sources[0], RuntimeError("last"))
+    run_once()
+    run_once()
+
+    assert len(errors) == 1
+    assert txaio.failure_message(errors[0]) == 'RuntimeError: last'
+
+
+def test_quorum(framework):
+    '''
+    we get the first k results in order of arrival, and fail as soon
+    as k can't succeed
+    '''
+    sources = [txaio.create_future() for _ in range(4)]
+    results = []
+
+    f = txaio.quorum(sources, 2)
+    txaio.add_callbacks(f, results.append, None)
+    txaio.resolve(sources[3], 'three')
+    txaio.reject(sources[0], RuntimeError("sadness"))
+    run_once()
+    assert results == []
+    txaio.resolve(sources[1], 'one')
+    run_once()
+    run_once()
+    assert results == [['three', 'one']]
+    assert txaio.is_called(sources[2])
+
+    sources = [txaio.create_future() for _ in range(3)]
+    errors = []
+    f = txaio.quorum(sources, 2)
+    txaio.add_callbacks(f, None, errors.append)
+    txaio.reject(sources[0], RuntimeError("sadness"))
+    txaio.reject(sources[2], RuntimeError("more sadness"))
+    run_once()
+    run_once()
+    assert len(errors) == 1
+    assert txaio.is_called(sources[1])
+
+    with pytest.raises(ValueError):
+        txaio.quorum(sources, 4)
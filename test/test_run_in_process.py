@@ -0,0 +1,146 @@
+###############################################################################
+#
+# The MIT License (MIT)
+#
+# Copyright (c) Crossbar.io Technologies GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+import os
+import time
+
+import pytest
+
+import txaio
+
+pytest.importorskip('concurrent.futures')
+
+
+def test_run_in_process(framework_aio):
+    '''
+    calls made together are sent to the worker processes in chunks,
+    and one failing doesn't fail the rest
+    '''
+    import asyncio
+    loop = asyncio.new_event_loop()
+    try:
+        txa = txaio.with_config(loop=loop)
+        pool = txa.make_process_pool(max_workers=2, chunk_size=4)
+        txa._config.process_pool = pool
+        assert txa.get_process_pool() is pool
+
+        futures = [txa.run_in_process(divmod, n, 3) for n in range(6)]
+        futures.append(txa.run_in_process(divmod, 1, 0))
+        # they wait for the loop (there aren't enough to fill a chunk
+        # for each worker)
+        assert pool.stats() == dict(queued=7, running=0, chunks=0)
+        futures.append(txa.run_in_process(divmod, 7, 3))
+        # ...now there are: one chunk each
+        assert pool.stats() == dict(queued=0, running=8, chunks=2)
+
+        futures.extend(txa.run_in_process(divmod, n, 3) for n in range(8, 11))
+        loop.run_until_complete(asyncio.wait(futures, timeout=30, loop=loop))
+        results = [f.result() for f in futures if f is not futures[6]]
+        assert results == [divmod(n, 3) for n in range(11) if n != 6]
+        assert isinstance(futures[6].exception(), ZeroDivisionError)
+        # the last 3 were split in 2 chunks, for the 2 workers
+        assert pool.stats() == dict(queued=0, running=0, chunks=4)
+
+        pool.shutdown()
+        with pytest.raises(RuntimeError):
+            txa.run_in_process(divmod, 1, 1)
+    finally:
+        loop.close()
+
+
+def _sleep_pid(seconds):
+    time.sleep(seconds)
+    return os.getpid()
+
+
+def test_run_in_process_parallel(framework_aio):
+    '''
+    calls made together are split over the workers, so they run in
+    parallel
+    '''
+    import asyncio
+    loop = asyncio.new_event_loop()
+    try:
+        txa = txaio.with_config(loop=loop)
+        pool = txa.make_process_pool(max_workers=2, chunk_size=16)
+        txa._config.process_pool = pool
+
+        futures = [txa.run_in_process(_sleep_pid, 0.5) for _ in range(4)]
+        loop.run_until_complete(asyncio.wait(futures, timeout=30, loop=loop))
+        assert pool.stats()['chunks'] == 2
+        assert len(set(f.result() for f in futures)) == 2
+        pool.shutdown()
+    finally:
+        loop.close()
+
+
+def test_shared_process_pool(framework_aio):
+    '''
+    with_config() instances share a process pool, until it's shut down
+    '''
+    import asyncio
+    loop = asyncio.new_event_loop()
+    try:
+        txa = txaio.with_config(loop=loop)
+        txb = txaio.with_config(loop=loop)
+        pool = txa.get_process_pool()
+        assert txb.get_process_pool() is pool
+        pool.shutdown()
+        assert txb.get_process_pool() is not pool
+        txb.get_process_pool().shutdown()
+    finally:
+        loop.close()
+
+
+def test_process_pool_two_loops(framework_aio):
+    '''
+    calls made (with a shared pool) from two loops are sent when
+    either of them runs
+    '''
+    import asyncio
+    loop_a = asyncio.new_event_loop()
+    loop_b = asyncio.new_event_loop()
+    try:
+        txa = txaio.with_config(loop=loop_a)
+        txb = txaio.with_config(loop=loop_b)
+        pool = txa.make_process_pool(max_workers=2, chunk_size=4)
+        txa._config.process_pool = pool
+        txb._config.process_pool = pool
+
+        fa = txa.run_in_process(divmod, 7, 3)
+        fb = txb.run_in_process(divmod, 8, 3)
+        assert pool.stats() == dict(queued=2, running=0, chunks=0)
+        # only loop_b runs; its call mustn't wait for loop_a
+        loop_b.run_until_complete(asyncio.wait([fb], timeout=30, loop=loop_b))
+        assert fb.result() == (2, 2)
+        # (loop_b's flush sent loop_a's call too)
+        loop_a.run_until_complete(asyncio.wait([fa], timeout=30, loop=loop_a))
+        assert fa.result() == (2, 1)
+        assert pool.stats() == dict(queued=0, running=0, chunks=2)
+        pool.shutdown()
+    finally:
+        loop_a.close()
+        loop_b.close()
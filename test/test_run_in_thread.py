@@ -0,0 +1,135 @@
+###############################################################################
+#
+# The MIT License (MIT)
+#
+# Copyright (c) Crossbar.io Technologies GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+import time
+import threading
+
+import pytest
+
+import txaio
+
+
+def test_run_in_thread(framework_aio):
+    '''
+    blocking calls run in the pool's threads (at most as many as
+    configured) and their results come back to the loop
+    '''
+    import asyncio
+    loop = asyncio.new_event_loop()
+    try:
+        txa = txaio.with_config(loop=loop)
+        txa._config.thread_pool_size = 2
+        gate = threading.Event()
+        threads = set()
+
+        def blocking(n):
+            gate.wait(5)
+            threads.add(threading.current_thread())
+            if n == 3:
+                raise RuntimeError("sadness")
+            return n * 2
+
+        futures = [txa.run_in_thread(blocking, n) for n in range(5)]
+        pool = txa.get_thread_pool()
+        for _ in range(500):
+            stats = pool.stats()
+            if stats['busy'] == 2:
+                break
+            time.sleep(0.01)
+        assert stats['threads'] == 2
+        assert stats['queued'] == 3
+
+        gate.set()
+        loop.run_until_complete(asyncio.wait(futures, loop=loop))
+        assert [f.result() for f in futures if not f.exception()] == [0, 2, 4, 8]
+        assert isinstance(futures[3].exception(), RuntimeError)
+        assert len(threads) == 2
+        assert threading.current_thread() not in threads
+
+        assert pool.shutdown(timeout=5)
+        assert pool.stats()['completed'] == 5
+        assert pool.stats()['threads'] == 0
+        with pytest.raises(RuntimeError):
+            txa.run_in_thread(blocking, 0)
+    finally:
+        loop.close()
+
+
+def test_thread_pool_graceful_shutdown(framework_aio):
+    '''
+    calls queued before shutdown still run
+    '''
+    import asyncio
+    loop = asyncio.new_event_loop()
+    try:
+        txa = txaio.with_config(loop=loop)
+        pool = txa.make_thread_pool(1)
+        gate = threading.Event()
+        ran = []
+
+        def blocking(n):
+            gate.wait(5)
+            ran.append(n)
+
+        futures = [pool.run_in_thread(blocking, n) for n in range(3)]
+        assert not pool.shutdown(wait=False)
+        gate.set()
+        assert pool.shutdown(timeout=5)
+        assert ran == [0, 1, 2]
+        loop.run_until_complete(asyncio.wait(futures, loop=loop))
+    finally:
+        loop.close()
+
+    with pytest.raises(ValueError):
+        txaio.make_thread_pool(0)
+
+
+def test_run_in_thread_tx(framework_tx):
+    '''
+    on Twisted, results come back with callFromThread()
+    '''
+    class FakeReactor(object):
+        def __init__(self):
+            self.calls = []
+
+        def callFromThread(self, func, *args):
+            self.calls.append((func, args))
+
+    old_loop = txaio.config.loop
+    txaio.config.loop = reactor = FakeReactor()
+    try:
+        pool = txaio.make_thread_pool(1)
+        results = []
+        d = pool.run_in_thread(lambda x: x + 1, 41)
+        txaio.add_callbacks(d, results.append, None)
+        assert pool.shutdown(timeout=5)
+
+        assert len(reactor.calls) == 1 and not results
+        func, args = reactor.calls[0]
+        func(*args)
+        assert results == [42]
+    finally:
+        txaio.config.loop = old_loop
@@ -0,0 +1,209 @@
+###############################################################################
+#
+# The MIT License (MIT)
+#
+# Copyright (c) Crossbar.io Technologies GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+import pytest
+import txaio
+from txaio.testutil import replace_loop
+
+
+def test_timeout_tx(framework_tx):
+    '''
+    a Deferred that takes too long is errbacked with a TimeoutError
+    '''
+    from twisted.internet.task import Clock
+    from twisted.internet.defer import TimeoutError
+
+    errors = []
+    with replace_loop(Clock()) as new_loop:
+        d = txaio.create_future()
+        assert txaio.with_timeout(d, 5) is d
+        txaio.add_callbacks(d, None, errors.append)
+        new_loop.advance(4.9)
+        assert errors == []
+        new_loop.advance(0.1)
+        assert len(errors) == 1
+        assert errors[0].check(TimeoutError)
+        assert new_loop.getDelayedCalls() == []
+
+
+def test_timeout_tx_completed(framework_tx):
+    '''
+    the timeout is cancelled when the Deferred fires
+    '''
+    from twisted.internet.task import Clock
+
+    results = []
+    with replace_loop(Clock()) as new_loop:
+        d = txaio.with_timeout(txaio.create_future(), 5)
+        txaio.add_callbacks(d, results.append, None)
+        assert len(new_loop.getDelayedCalls()) == 1
+        txaio.resolve(d, 'result')
+        assert new_loop.getDelayedCalls() == []
+        assert results == ['result']
+
+
+def test_timeout_tx_batched(framework_tx):
+    '''
+    with a batched timer, many timeouts share its buckets
+    '''
+    from twisted.internet.task import Clock
+    from twisted.internet.defer import TimeoutError
+
+    errors = []
+    with replace_loop(Clock()) as new_loop:
+        batched = txaio.make_batched_timer(1, chunk_size=1000)
+        futures = [
+            txaio.with_timeout(txaio.create_future(), 5, timer=batched)
+            for _ in range(1000)
+        ]
+        for d in futures:
+            txaio.add_callbacks(d, None, errors.append)
+        assert len(new_loop.getDelayedCalls()) == 1
+
+        for d in futures[:10]:
+            txaio.resolve(d, None)
+        assert batched.stats()['cancelled'] == 10
+        new_loop.advance(5)
+        assert len(errors) == 990
+        assert all(f.check(TimeoutError) for f in errors)
+
+
+def test_timeout_aio(framework_aio):
+    '''
+    a Future that takes too long is rejected with a TimeoutError;
+    the timeout of one that doesn't is cancelled
+    '''
+    # Trollius doesn't come with this, so won't work on py2
+    pytest.importorskip('asyncio.test_utils')
+    from asyncio.test_utils import TestLoop
+    import asyncio
+
+    def time_gen():
+        yield
+        yield
+        yield
+    new_loop = TestLoop(time_gen)
+    with replace_loop(new_loop):
+        slow = txaio.with_timeout(txaio.create_future(), 5)
+        fast = txaio.with_timeout(txaio.create_future(), 5)
+        assert len(new_loop._scheduled) == 2
+        txaio.resolve(fast, 'result')
+        new_loop._run_once()
+        assert len([h for h in new_loop._scheduled if not h._cancelled]) == 1
+
+        new_loop.advance_time(5)
+        new_loop._run_once()
+        assert fast.result() == 'result'
+        with pytest.raises(asyncio.TimeoutError):
+            slow.result()
+
+
+def test_timeout_aio_batched_task(framework_aio):
+    '''
+    a Task can't be rejected, so it's cancelled instead (but callbacks
+    get a TimeoutError, as for other futures)
+    '''
+    pytest.importorskip('asyncio.test_utils')
+    from asyncio.test_utils import TestLoop
+    import asyncio
+
+    def time_gen():
+        yield
+        yield
+        yield
+        yield
+        yield
+    new_loop = TestLoop(time_gen)
+    with replace_loop(new_loop):
+        batched = txaio.make_batched_timer(1)
+        task = asyncio.ensure_future(asyncio.sleep(100, loop=new_loop), loop=new_loop)
+        assert txaio.with_timeout(task, 5, timer=batched) is task
+        errors = []
+        txaio.add_callbacks(task, None, errors.append)
+        new_loop._run_once()
+        new_loop.advance_time(5)
+        new_loop._run_once()
+        new_loop._run_once()
+        new_loop._run_once()
+        assert task.cancelled()
+        assert len(errors) == 1
+        assert isinstance(errors[0].value, asyncio.TimeoutError)
+        assert 'Timed out after 5 seconds' in txaio.failure_message(errors[0])
+
+        # a Task cancelled otherwise is still just cancelled
+        other = asyncio.ensure_future(asyncio.sleep(100, loop=new_loop), loop=new_loop)
+        txaio.with_timeout(other, 5, timer=batched)
+        txaio.add_callbacks(other, None, errors.append)
+        new_loop._run_once()
+        other.cancel()
+        new_loop._run_once()
+        new_loop._run_once()
+        assert len(errors) == 2
+        assert isinstance(errors[1].value, asyncio.CancelledError)
+
+
+def test_timeout_late_result(framework):
+    '''
+    whatever was going to complete a future can still do so after it
+    timed out; that's ignored
+    '''
+    errors = []
+    results = []
+
+    if txaio.using_twisted:
+        from twisted.internet.task import Clock
+        new_loop = Clock()
+    else:
+        pytest.importorskip('asyncio.test_utils')
+        from asyncio.test_utils import TestLoop
+
+        def time_gen():
+            yield
+            yield
+            yield
+        new_loop = TestLoop(time_gen)
+
+    with replace_loop(new_loop):
+        resolved = txaio.with_timeout(txaio.create_future(), 5)
+        rejected = txaio.with_timeout(txaio.create_future(), 5)
+        for f in (resolved, rejected):
+            txaio.add_callbacks(f, results.append, errors.append)
+        if txaio.using_twisted:
+            new_loop.advance(5)
+        else:
+            new_loop.advance_time(5)
+            new_loop._run_once()
+            new_loop._run_once()
+
+        txaio.resolve(resolved, 'late')
+        txaio.reject(rejected, RuntimeError("late"))
+        if txaio.using_asyncio:
+            new_loop._run_once()
+
+    assert results == []
+    assert len(errors) == 2
+    for fail in errors:
+        assert 'Timed out' in txaio.failure_message(fail)
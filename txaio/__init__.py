@@ -56,6 +56,31 @@ class _Config(object):
     #: the event-loop object to use
     loop = None
 
+    #: asyncio only: if True, :meth:`as_future` runs coroutines
+    #: eagerly (see :meth:`as_future_eager`)
+    eager_coroutines = False
+
+    #: if True, :meth:`create_failure` makes compact failures, which
+    #: keep a summary of the traceback instead of its frames (and
+    #: their local variables)
+    compact_failures = False
+
+    #: the most threads that the thread pool of :meth:`run_in_thread`
+    #: starts (when it does so)
+    thread_pool_size = 10
+
+    #: the thread pool :meth:`run_in_thread` uses; if None, it's
+    #: created (see :meth:`get_thread_pool`) when first needed
+    thread_pool = None
+
+    #: the process pool :meth:`run_in_process` uses; if None, one
+    #: shared by all configs is used (see :meth:`get_process_pool`)
+    process_pool = None
+
+    #: how many processes the shared process pool has (if None, one
+    #: per CPU) when it's created
+    process_pool_size = None
+
 
 __all__ = (
     'with_config',              # allow mutliple custom configurations at once
@@ -71,20 +96,35 @@ __all__ = (
     'create_future_error',
     'create_failure',           # return an object implementing IFailedFuture
     'as_future',                # call a method, and always return a Future
+    'as_future_eager',          # ...running a coroutine until it first suspends
     'is_future',                # True for Deferreds in tx and Futures, @coroutines in asyncio
     'reject',                   # errback a Future
     'resolve',                  # callback a Future
+    'resolve_threadsafe',       # resolve, from any thread
+    'reject_threadsafe',        # reject, from any thread
+    'run_in_thread',            # call a blocking function in a thread, get a Future
+    'make_thread_pool',         # a thread pool of a given size, for run_in_thread
+    'get_thread_pool',          # the thread pool run_in_thread uses
+    'run_in_process',           # call a CPU-bound function in another process, get a Future
+    'make_process_pool',        # a process pool, for run_in_process
+    'get_process_pool',         # the process pool run_in_process uses
     'add_callbacks',            # add callback and/or errback
     'gather',                   # return a Future waiting for several other Futures
+    'map_concurrent',           # call a function on many items, a few at a time
+    'as_completed',             # iterate over outcomes in the order they complete
+    'race',                     # first success of several futures; cancels the rest
+    'quorum',                   # first k successes of several futures; cancels the rest
     'is_called',                # True if the Future has a result
 
     'call_later',               # call the callback after the given delay seconds
+    'with_timeout',             # reject a Future if it takes too long
 
     'failure_message',          # a printable error-message from a IFailedFuture
     'failure_traceback',        # returns a traceback instance from an IFailedFuture
     'failure_format_traceback',     # a string, the formatted traceback
 
     'make_batched_timer',       # create BatchedTimer/IBatchedTimer instances
+    'make_sharded_batched_timer',   # thread-safe batched timers, one per loop
 
     'make_logger',              # creates an object implementing ILogger
     'start_logging',            # initializes logging (may grab stdin at this point)
@@ -1,28 +1,234 @@
 
+import sys
+import copy
 import math
+import weakref
+import multiprocessing
+import threading
+from bisect import bisect_left
+from collections import deque
+from functools import partial
+from timeit import default_timer as _wall_clock
+
+import six
+
 from txaio.interfaces import IBatchedTimer
 
 
 class _BatchedCall(object):
     """
     Wraps IDelayedCall-implementing objects, implementing only the API
-    which txaio promised in the first place: .cancel
+    which txaio promised in the first place: .cancel (plus .reset,
+    .delay and .active which move a call to another bucket in place,
+    or tell if it is still pending)
 
     Do not create these yourself; use _BatchedTimer.call_later()
+
+    There can be very many of these, so they're kept small: no
+    ``__dict__``, no closure for the call itself and only a weak
+    reference back to the timer (shared by all its calls, so no
+    reference cycles either). ``_timer_ref`` is None once the call
+    has happened or been cancelled.
     """
 
-    def __init__(self, timer, index, the_call):
-        # XXX WeakRef?
-        self._timer = timer
+    __slots__ = ('_timer_ref', '_index', '_func', '_args', '_kwargs')
+
+    def __init__(self, timer_ref, index, func, args, kwargs):
+        self._timer_ref = timer_ref
         self._index = index
-        self._call = the_call
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs or None
+
+    def _get_timer(self, action):
+        ref = self._timer_ref
+        timer = None if ref is None else ref()
+        if timer is None:
+            raise RuntimeError(
+                "Can't {} a batched call that already happened or was cancelled".format(action)
+            )
+        return timer
 
     def cancel(self):
-        self._timer._remove_call(self._index, self)
-        self._timer = None
+        # once we've been called (or cancelled) _timer_ref is None, so
+        # cancelling is a no-op
+        ref = self._timer_ref
+        if ref is not None:
+            self._timer_ref = None
+            # a cancelled call may sit in its bucket for a while; don't
+            # keep the function and its arguments alive meanwhile
+            self._func = self._args = self._kwargs = None
+            timer = ref()
+            if timer is not None:
+                timer._cancelled += 1
+                # (a call waiting for its jitter offset is no longer in
+                # a bucket; see _BatchedTimer._jitter_calls)
+                if ref is timer._timer_ref:
+                    timer._remove_call(self._index, self)
+
+    def reset(self, delay):
+        """
+        Re-schedule this call to happen ``delay`` seconds from now. If
+        that is in the same bucket as before, nothing changes at all.
+        """
+        timer = self._get_timer("reset")
+        now = timer._get_seconds()
+        timer._move_call(self, now, timer._bucket_for(now, delay))
+
+    def delay(self, extra):
+        """
+        Re-schedule this call to happen ``extra`` seconds later than the
+        time of the bucket it is in now.
+        """
+        timer = self._get_timer("delay")
+        deadline = timer._bucket_time(self._index) + extra
+        timer._move_call(self, timer._get_seconds(), timer._bucket_for(deadline, 0))
+
+    def active(self):
+        """
+        :returns: True if this call hasn't happened (or been cancelled) yet
+        """
+        return self._timer_ref is not None
 
     def __call__(self):
-        return self._call()
+        func, args, kwargs = self._func, self._args, self._kwargs
+        self._func = self._args = self._kwargs = None
+        if kwargs is None:
+            return func(*args)
+        return func(*args, **kwargs)
+
+
+class _PeriodicCall(object):
+    """
+    What _BatchedTimer.call_every() returns. Each tick is a batched
+    call (so periodic calls share buckets with everything else) for
+    ``start + n * interval``, so we don't drift; if the loop is
+    overloaded and ticks were missed, we skip them instead of doing
+    them all at once.
+    """
+
+    __slots__ = ('_timer_ref', '_interval', '_start', '_tick', '_call',
+                 '_func', '_args', '_kwargs')
+
+    def __init__(self, timer_ref, interval, start, func, args, kwargs):
+        self._timer_ref = timer_ref
+        self._interval = interval
+        self._start = start
+        self._tick = 1  # the first call is one interval after start
+        self._call = None
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+
+    def _schedule(self, timer, now):
+        deadline = self._start + (self._tick * self._interval)
+        self._call = timer.call_later(deadline - now, self._run)
+
+    def _run(self):
+        timer = self._timer_ref()
+        if timer is None:
+            return
+        now = timer._get_seconds()
+        # the next tick that's still in the future (but never the one
+        # we're doing, in case its bucket was a little early)
+        missed = int(math.floor((now - self._start) / self._interval))
+        tick = max(self._tick, missed) + 1
+        # ...and in a later bucket than the one firing now: with an
+        # interval shorter than a bucket we can only do one call per
+        # bucket, so we skip the ticks in between rather than having
+        # them all pile up in this bucket
+        firing = self._call._index
+        after = timer._bucket_time(firing + 1)
+        tick = max(tick, int(math.floor((after - self._start) / self._interval)) - 1)
+        while timer._bucket_for(self._start + tick * self._interval, 0) <= firing:
+            tick += 1
+        self._tick = tick
+        self._schedule(timer, now)
+        self._func(*self._args, **self._kwargs)
+
+    def cancel(self):
+        """
+        Stop doing the periodic call.
+        """
+        if self._call is not None:
+            self._call.cancel()
+            self._call = None
+            self._func = self._args = self._kwargs = None
+
+    def active(self):
+        """
+        :returns: True if this periodic call hasn't been cancelled (nor
+            its timer's calls, with ``cancel_all()``)
+        """
+        return self._call is not None and self._call.active()
+
+
+# deadlines are divided by the bucket size in floating-point, so we
+# allow for a little noise when rounding (otherwise e.g. 0.3 seconds
+# with 100ms buckets might land in bucket 2 instead of 3).
+_ROUNDING_SLACK = 1e-9
+
+_rounding = {
+    # the bucket at or before the deadline (the default)
+    'floor': lambda buckets: int(math.floor(buckets + _ROUNDING_SLACK)),
+    # the bucket at or after the deadline; calls are never early
+    'ceil': lambda buckets: int(math.ceil(buckets - _ROUNDING_SLACK)),
+    # whichever bucket is closest to the deadline
+    'nearest': lambda buckets: int(math.floor(buckets + 0.5)),
+}
+
+# with jitter, a bucket's calls are split into 1 << _JITTER_BITS
+# slices spread over the jitter window; which slice a call goes in
+# comes from (the top bits of) its key's hash times this odd constant
+# (so similar hashes, e.g. of objects next to each other in memory,
+# still land in different slices).
+_JITTER_BITS = 4
+_JITTER_MIX = 0x9E3779B1
+
+
+def _default_jitter_key(func, *args, **kwargs):
+    # bound methods (e.g. a protocol's ping timeout) share the
+    # offset of their instance (which might not be hashable)
+    return id(getattr(func, '__self__', func))
+
+
+# the time-budget (in seconds) drain() uses if the timer hasn't one
+_DRAIN_BUDGET = 0.005
+
+# the upper bounds (in seconds) of the bins in the histogram of how
+# late calls are done, relative to their bucket's time; see stats()
+_LATENESS_BINS = (0.001, 0.01, 0.1, 1.0, 10.0, float('inf'))
+
+# cancelled calls are left in their bucket's list (and skipped when it
+# is notified) until more than half of the list is dead; then the list
+# is compacted. Lists shorter than this are never compacted.
+_COMPACT_MIN = 32
+
+
+class _Bucket(object):
+    """
+    Internal helper. One bucket of a _BatchedTimer.
+    """
+
+    __slots__ = ('delayed_call', 'calls', 'live')
+
+    def __init__(self, delayed_call, calls):
+        self.delayed_call = delayed_call
+        self.calls = calls
+        self.live = len(calls)  # number of non-cancelled calls
+
+
+class _BucketErrors(object):
+    """
+    Internal helper. The failures from doing one bucket's calls; all
+    of them are counted but only the first ``max_errors`` are kept.
+    """
+
+    __slots__ = ('failures', 'count')
+
+    def __init__(self):
+        self.failures = []
+        self.count = 0
 
 
 class _BatchedTimer(IBatchedTimer):
@@ -38,58 +244,416 @@ class _BatchedTimer(IBatchedTimer):
     """
 
     def __init__(self, bucket_milliseconds, chunk_size,
-                 seconds_provider, delayed_call_creator, loop=None):
+                 seconds_provider, delayed_call_creator, loop=None,
+                 rounding='floor', budget_milliseconds=None,
+                 failure_creator=None, on_error=None, max_errors=None,
+                 jitter_milliseconds=None, jitter_key=None,
+                 future_creator=None, future_resolver=None,
+                 future_rejecter=None):
         if bucket_milliseconds <= 0.0:
             raise ValueError(
                 "bucket_milliseconds must be > 0.0"
             )
+        try:
+            self._round = _rounding[rounding]
+        except KeyError:
+            raise ValueError(
+                "Unknown rounding '{}'; valid are: {}".format(
+                    rounding, ', '.join(sorted(_rounding.keys())),
+                )
+            )
+        if budget_milliseconds is not None and budget_milliseconds <= 0.0:
+            raise ValueError(
+                "budget_milliseconds must be > 0.0"
+            )
+        if max_errors is not None and max_errors < 0:
+            raise ValueError(
+                "max_errors must be >= 0"
+            )
+        if jitter_milliseconds is not None and jitter_milliseconds <= 0.0:
+            raise ValueError(
+                "jitter_milliseconds must be > 0.0"
+            )
         self._bucket_milliseconds = float(bucket_milliseconds)
         self._chunk_size = chunk_size
+        # with a time-budget, we do calls until we've used up the
+        # budget and then yield to the reactor; how many calls we do
+        # between looking at the clock adapts to how long they take.
+        if budget_milliseconds is None:
+            self._budget = None
+        else:
+            self._budget = budget_milliseconds / 1000.0
+        self._budget_chunk = 1
+        self._call_cost = None  # (moving) average seconds per call
         self._get_seconds = seconds_provider
         self._create_delayed_call = delayed_call_creator
-        self._buckets = dict()  # real seconds -> (IDelayedCall, list)
+        # errors from calls are turned into IFailedFuture instances
+        # and given to on_error (if any) as they happen; otherwise,
+        # (up to max_errors of) them are raised when a bucket is done
+        self._create_failure = failure_creator
+        self._on_error = on_error
+        self._max_errors = max_errors
+        # for sleep() and drain(): future_creator(canceller) returns a
+        # new framework-native future which calls canceller(future) if
+        # it's cancelled; future_resolver(future) resolves it and
+        # future_rejecter(future, error) rejects it (unless it's
+        # already done)
+        self._create_future = future_creator
+        self._resolve_future = future_resolver
+        self._reject_future = future_rejecter
+        self._buckets = dict()  # bucket number -> _Bucket
+        # all our calls share this; see _BatchedCall
+        self._timer_ref = weakref.ref(self)
+        # with jitter, calls from a due bucket that are waiting for
+        # their offset have this (distinct) reference instead, so they
+        # can still be cancelled or moved; see _jitter_calls
+        if jitter_milliseconds is None:
+            self._jitter = None
+            self._jitter_ref = None
+        else:
+            self._jitter = jitter_milliseconds / 1000.0
+            self._jitter_ref = weakref.ref(self, lambda ref: None)
+        # id(slice) -> (IDelayedCall, slice) for each slice of calls
+        # waiting for its jitter offset
+        self._jittering = {}
+        self._jitter_key = jitter_key or _default_jitter_key
+        # statistics; see stats()
+        self._scheduled = 0
+        self._fired = 0
+        self._cancelled = 0
+        self._lateness = [0] * len(_LATENESS_BINS)
+        self._chunks = 0
+        self._chunk_seconds = 0.0
+        self._chunk_seconds_max = 0.0
         self._loop = loop
 
     def call_later(self, delay, func, *args, **kwargs):
         """
         IBatchedTimer API
         """
-        # "quantize" the delay to the nearest bucket
         now = self._get_seconds()
-        real_time = int(now + delay) * 1000
-        real_time -= int(real_time % self._bucket_milliseconds)
-        call = _BatchedCall(self, real_time, lambda: func(*args, **kwargs))
+        index = self._bucket_for(now, delay)
+        call = _BatchedCall(self._timer_ref, index, func, args, kwargs)
+        self._add_call(now, index, call)
+        self._scheduled += 1
+        return call
+
+    def call_later_many(self, entries):
+        """
+        IBatchedTimer API
+        """
+        now = self._get_seconds()
+        timer_ref = self._timer_ref
+        handles = []
+        buckets = {}
+        for entry in entries:
+            args = tuple(entry[2]) if len(entry) > 2 else ()
+            kwargs = entry[3] if len(entry) > 3 else None
+            index = self._bucket_for(now, entry[0])
+            call = _BatchedCall(timer_ref, index, entry[1], args, kwargs)
+            handles.append(call)
+            try:
+                buckets[index].append(call)
+            except KeyError:
+                buckets[index] = [call]
+        for (index, calls) in buckets.items():
+            self._add_calls(now, index, calls)
+        self._scheduled += len(handles)
+        return handles
+
+    def call_every(self, interval, func, *args, **kwargs):
+        """
+        IBatchedTimer API
+        """
+        if interval <= 0.0:
+            raise ValueError(
+                "interval must be > 0.0"
+            )
+        now = self._get_seconds()
+        periodic = _PeriodicCall(self._timer_ref, interval, now, func, args, kwargs)
+        periodic._schedule(self, now)
+        return periodic
+
+    def sleep(self, delay):
+        """
+        IBatchedTimer API
+        """
+        def cancel(future):
+            call.cancel()
+        future = self._create_future(cancel)
+        call = self.call_later(delay, self._resolve_future, future)
+        return future
+
+    def cancel_all(self):
+        """
+        IBatchedTimer API
+        """
+        calls = self._take_calls()
+        for call in calls:
+            call._func = call._args = call._kwargs = None
+        self._cancelled += len(calls)
+
+    def drain(self):
+        """
+        IBatchedTimer API
+        """
+        future = self._create_future(lambda future: None)
+        calls = self._take_calls()
+        if not calls:
+            self._resolve_future(future)
+            return future
+        # in deadline order (sort is stable, so within a bucket too)
+        calls.sort(key=lambda call: call._index)
+        self._fired += len(calls)
+
+        def done(errors):
+            # (rather than raising them from here, or in the reactor)
+            error = self._errors_error(errors)
+            if error is None:
+                self._resolve_future(future)
+            else:
+                self._reject_future(future, error)
+        self._notify_budgeted(
+            calls, 0, _BucketErrors(), self._get_seconds(),
+            self._budget or _DRAIN_BUDGET, done,
+        )
+        return future
+
+    def _take_calls(self):
+        """
+        Internal helper. Removes every pending call (and cancels the
+        underlying delayed calls), marks them done and returns them.
+        """
+        buckets = self._buckets
+        self._buckets = dict()
+        timer_ref = self._timer_ref
+        calls = []
+        for (index, bucket) in buckets.items():
+            bucket.delayed_call.cancel()
+            for call in bucket.calls:
+                if call._timer_ref is timer_ref and call._index == index:
+                    call._timer_ref = None
+                    calls.append(call)
+        calls.extend(self._take_jittering())
+        return calls
+
+    def _take_jittering(self):
+        """
+        Internal helper. As _take_calls, for calls waiting for their
+        jitter offset.
+        """
+        jittering = self._jittering
+        self._jittering = {}
+        jitter_ref = self._jitter_ref
+        calls = []
+        for (delayed_call, slice_calls) in jittering.values():
+            delayed_call.cancel()
+            for call in slice_calls:
+                if call._timer_ref is jitter_ref:
+                    call._timer_ref = None
+                    calls.append(call)
+        return calls
+
+    def stats(self):
+        """
+        IBatchedTimer API
+        """
+        bucket_sizes = self._bucket_sizes()
+        return {
+            'buckets': len(bucket_sizes),
+            'pending': sum(bucket_sizes.values()),
+            'bucket_sizes': bucket_sizes,
+            'scheduled': self._scheduled,
+            'fired': self._fired,
+            'cancelled': self._cancelled,
+            'lateness': list(zip(_LATENESS_BINS, self._lateness)),
+            'chunks': self._chunks,
+            'chunk_seconds': self._chunk_seconds,
+            'chunk_seconds_max': self._chunk_seconds_max,
+        }
+
+    def _bucket_sizes(self):
+        """
+        Internal helper. Returns a dict mapping the time of each bucket
+        (in seconds) to the number of pending calls in it.
+        """
+        return dict(
+            (self._bucket_time(index), bucket.live)
+            for (index, bucket) in self._buckets.items()
+        )
+
+    def _record_chunk(self, due, count, began, finished):
+        """
+        Internal helper. Keeps statistics for a chunk of ``count`` calls
+        from a bucket due at ``due`` (in seconds) which ran from
+        ``began`` until ``finished`` (wall-clock seconds).
+        """
+        lateness = self._get_seconds() - due
+        self._lateness[bisect_left(_LATENESS_BINS, lateness)] += count
+        elapsed = finished - began
+        self._chunks += 1
+        self._chunk_seconds += elapsed
+        if elapsed > self._chunk_seconds_max:
+            self._chunk_seconds_max = elapsed
+
+    def _bucket_for(self, now, delay):
+        """
+        Internal helper. "quantize" the delay to a bucket (according to
+        our rounding policy), returning the bucket's number. Bucket
+        ``n`` fires at ``n * bucket_milliseconds``
+        """
+        return self._round(((now + delay) * 1000.0) / self._bucket_milliseconds)
+
+    def _bucket_time(self, index):
+        """
+        Internal helper. The time (in seconds) at which bucket number
+        ``index`` is due.
+        """
+        return (index * self._bucket_milliseconds) / 1000.0
+
+    def _add_call(self, now, index, call):
+        """
+        Internal helper. Adds a call to the bucket number ``index``
+        """
         try:
-            self._buckets[real_time][1].append(call)
+            bucket = self._buckets[index]
         except KeyError:
             # new bucket; need to add "actual" underlying IDelayedCall
-            diff = (real_time / 1000.0) - now
-            # we need to clamp this because if we quantized to the
-            # nearest second, but that second is actually (slightly)
-            # less than the current time 'diff' will be negative.
+            diff = self._bucket_time(index) - now
+            # we need to clamp this because if we quantized "down" to
+            # a bucket that is actually (slightly) less than the
+            # current time 'diff' will be negative.
             delayed_call = self._create_delayed_call(
                 max(0.0, diff),
-                self._notify_bucket, real_time,
+                self._notify_bucket, index,
             )
-            self._buckets[real_time] = (delayed_call, [call])
-        return call
+            self._buckets[index] = _Bucket(delayed_call, [call])
+        else:
+            bucket.calls.append(call)
+            bucket.live += 1
 
-    def _notify_bucket(self, real_time):
+    def _add_calls(self, now, index, calls):
+        """
+        Internal helper. Adds several calls to the bucket number ``index``
+        """
+        try:
+            bucket = self._buckets[index]
+        except KeyError:
+            delayed_call = self._create_delayed_call(
+                max(0.0, self._bucket_time(index) - now),
+                self._notify_bucket, index,
+            )
+            self._buckets[index] = _Bucket(delayed_call, calls)
+        else:
+            bucket.calls.extend(calls)
+            bucket.live += len(calls)
+
+    def _notify_bucket(self, index):
         """
         Internal helper. This 'does' the callbacks in a particular bucket.
 
-        :param real_time: the bucket to do callbacks on
+        :param index: the bucket to do callbacks on
+        """
+        bucket = self._buckets.pop(index)
+        calls = self._live_calls(bucket.calls, index)
+        if calls:
+            self._notify_calls(calls, self._bucket_time(index))
+
+    def _live_calls(self, calls, index):
+        """
+        Internal helper. Returns the calls which are still live (not
+        cancelled) and due at ``index``, marking them as done.
+        """
+        live = []
+        timer_ref = self._timer_ref
+        done_ref = self._jitter_ref  # None, unless we have jitter
+        for call in calls:
+            if call._timer_ref is timer_ref and call._index <= index:
+                call._timer_ref = done_ref
+                live.append(call)
+        if done_ref is None:
+            self._fired += len(live)
+        return live
+
+    def _notify_calls(self, calls, due):
+        """
+        Internal helper. Does the given callbacks, ``chunk_size`` at a
+        time, spread over the bucket interval (or as many as fit into
+        our time-budget at a time, if we have one). With jitter, the
+        calls are first spread over the jitter window.
+
+        :param calls: a list of _BatchedCall instances
+
+        :param due: the time of their bucket (in seconds)
+        """
+        if self._jitter is not None:
+            return self._jitter_calls(calls, due)
+        self._notify_chunks(calls, due)
+
+    def _jitter_calls(self, calls, due):
+        """
+        Internal helper. Splits the calls from a due bucket into slices
+        by the hash of their jitter-key, and does each slice at its
+        offset into the jitter window (so a given key always gets the
+        same offset).
+        """
+        bits = 32 - _JITTER_BITS
+        key = self._jitter_key
+        slices = {}
+        for call in calls:
+            h = hash(key(call._func, *call._args, **(call._kwargs or {})))
+            h = ((h * _JITTER_MIX) & 0xffffffff) >> bits
+            try:
+                slices[h].append(call)
+            except KeyError:
+                slices[h] = [call]
+        now = self._get_seconds()
+        step = self._jitter / (1 << _JITTER_BITS)
+        for (h, slice_calls) in sorted(slices.items()):
+            when = due + (h * step)
+            if h == 0:
+                self._notify_jittered(slice_calls, when)
+            else:
+                delayed_call = self._create_delayed_call(
+                    max(0.0, when - now),
+                    self._notify_jittered, slice_calls, when,
+                )
+                self._jittering[id(slice_calls)] = (delayed_call, slice_calls)
+
+    def _notify_jittered(self, calls, due):
+        """
+        Internal helper. Does the calls from a slice of a bucket that
+        weren't cancelled or moved while waiting for their jitter
+        offset (``due``, in seconds).
+        """
+        self._jittering.pop(id(calls), None)
+        jitter_ref = self._jitter_ref
+        live = []
+        for call in calls:
+            if call._timer_ref is jitter_ref:
+                call._timer_ref = None
+                live.append(call)
+        self._fired += len(live)
+        if live:
+            self._notify_chunks(live, due)
+
+    def _notify_chunks(self, calls, due):
         """
-        (delayed_call, calls) = self._buckets[real_time]
-        del self._buckets[real_time]
-        errors = []
+        Internal helper. Does the given callbacks, as described in
+        _notify_calls.
+        """
+        if self._budget is not None:
+            return self._notify_budgeted(calls, 0, _BucketErrors(), due, self._budget)
+        errors = _BucketErrors()
 
         def notify_one_chunk(calls, chunk_size, chunk_delay_ms):
+            began = _wall_clock()
             for call in calls[:chunk_size]:
                 try:
                     call()
-                except Exception as e:
-                    errors.append(e)
+                except Exception:
+                    self._call_failed(errors)
+            self._record_chunk(due, min(chunk_size, len(calls)), began, _wall_clock())
             calls = calls[chunk_size:]
             if calls:
                 self._create_delayed_call(
@@ -98,11 +662,7 @@ class _BatchedTimer(IBatchedTimer):
                 )
             else:
                 # done all calls; make sure there were no errors
-                if len(errors):
-                    msg = u"Error(s) processing call_later bucket:\n"
-                    for e in errors:
-                        msg += u"{}\n".format(e)
-                    raise RuntimeError(msg)
+                self._raise_errors(errors)
         # ceil()ing because we want the number of chunks, and a
         # partial chunk is still a chunk
         delay_ms = self._bucket_milliseconds / math.ceil(float(len(calls)) / self._chunk_size)
@@ -110,20 +670,1240 @@ class _BatchedTimer(IBatchedTimer):
         # actually less than zero, but just being safe here
         notify_one_chunk(calls, self._chunk_size, max(0.0, delay_ms))
 
-    def _remove_call(self, real_time, call):
+    def _notify_budgeted(self, calls, start, errors, due, budget, done=None):
+        """
+        Internal helper. Does calls from ``start`` onwards until we've
+        used up our time-budget (``budget`` seconds), then yields to
+        the reactor (to carry on from where we left off) if there are
+        any left. Once they're all done, we call ``done(errors)`` if
+        given (otherwise, errors are raised).
+        """
+        end = len(calls)
+        first = start
+        now = slice_began = _wall_clock()
+        deadline = slice_began + budget
+        while start < end:
+            stop = min(end, start + self._budget_chunk)
+            began = _wall_clock()
+            for call in calls[start:stop]:
+                try:
+                    call()
+                except Exception:
+                    self._call_failed(errors)
+            now = _wall_clock()
+            self._adapt_budget_chunk(budget, (now - began) / (stop - start))
+            start = stop
+            if now >= deadline:
+                break
+        self._record_chunk(due, start - first, slice_began, now)
+        if start < end:
+            self._create_delayed_call(
+                0, self._notify_budgeted, calls, start, errors, due, budget, done,
+            )
+        elif done is not None:
+            done(errors)
+        else:
+            self._raise_errors(errors)
+
+    def _adapt_budget_chunk(self, budget, cost):
+        """
+        Internal helper. Updates our idea of how long a call takes (to
+        the given number of seconds) and so how many calls to do
+        between looking at the clock; we aim for about a quarter of
+        the time-budget so we never overshoot it by much.
+        """
+        if self._call_cost is None:
+            self._call_cost = cost
+        else:
+            self._call_cost = (0.75 * self._call_cost) + (0.25 * cost)
+        chunk = budget / (4.0 * max(self._call_cost, 1e-9))
+        self._budget_chunk = max(1, min(int(chunk), self._chunk_size))
+
+    def _call_failed(self, errors):
+        """
+        Internal helper. A call from a bucket raised an error; this
+        MUST be called from the "except" block.
+
+        :param errors: the bucket's _BucketErrors instance
+        """
+        errors.count += 1
+        if self._on_error is not None:
+            self._on_error(self._create_failure())
+        elif self._max_errors is None or len(errors.failures) < self._max_errors:
+            errors.failures.append(self._create_failure())
+
+    def _raise_errors(self, errors):
+        """
+        Internal helper. Raises an error if doing a bucket's calls
+        produced any (that weren't given to on_error); see
+        _errors_error.
+        """
+        error = self._errors_error(errors)
+        if error is not None:
+            raise error
+
+    def _errors_error(self, errors):
+        """
+        Internal helper. Returns a RuntimeError describing the errors
+        from doing a bucket's calls (that weren't given to on_error),
+        or None if there weren't any. The IFailedFuture instances we
+        kept are in its ``failures`` attribute.
+        """
+        if errors.count and self._on_error is None:
+            lines = [u"Error(s) processing call_later bucket:"]
+            lines.extend(u"{}".format(f.value) for f in errors.failures)
+            dropped = errors.count - len(errors.failures)
+            if dropped:
+                lines.append(u"(and {} more)".format(dropped))
+            lines.append(u"")
+            error = RuntimeError(u"\n".join(lines))
+            error.failures = errors.failures
+            return error
+        return None
+
+    def _move_call(self, call, now, index):
+        """
+        Internal helper. Moves a pending call to bucket number ``index``
+        (the same _BatchedCall instance is re-used)
+        """
+        if call._timer_ref is not self._timer_ref:
+            # it's waiting for its jitter offset (so isn't in a bucket)
+            call._timer_ref = self._timer_ref
+            call._index = index
+            self._add_call(now, index, call)
+            return
+        old_index = call._index
+        if index == old_index:
+            return  # the common case; same bucket so nothing to do
+        call._index = index
+        self._remove_call(old_index, call)
+        self._add_call(now, index, call)
+
+    def _remove_call(self, index, call):
+        """
+        Internal helper. ``call`` (which is still pending) was
+        cancelled or moved out of bucket ``index``. It stays in the
+        bucket's list and is skipped when the bucket is notified, so
+        this is O(1) (amortized, because we compact the list once it's
+        mostly cancelled calls).
+        """
+        bucket = self._buckets[index]
+        bucket.live -= 1
+        if not bucket.live:
+            # if we're empty, cancel underlying bucket-timeout
+            # IDelayedCall
+            del self._buckets[index]
+            bucket.delayed_call.cancel()
+        elif len(bucket.calls) > max(_COMPACT_MIN, 2 * bucket.live):
+            timer_ref = self._timer_ref
+            bucket.calls = [
+                c for c in bucket.calls
+                if c._timer_ref is timer_ref and c._index == index
+            ]
+
+
+# a timing-wheel has _WHEEL_LEVELS levels, each of which has
+# _WHEEL_SLOTS slots; so it can hold deadlines up to
+# _WHEEL_SLOTS ** _WHEEL_LEVELS buckets in the future (about 16.7
+# million) before anything ends up in the "overflow" list.
+_WHEEL_BITS = 6
+_WHEEL_SLOTS = 1 << _WHEEL_BITS
+_WHEEL_MASK = _WHEEL_SLOTS - 1
+_WHEEL_LEVELS = 4
+
+
+class _TimingWheel(_BatchedTimer):
+    """
+    Internal helper.
+
+    A hierarchical timing-wheel implementation of
+    :class:`txaio.IBatchedTimer`; it is what you get from
+    :meth:`txaio.make_batched_timer` when passing ``engine='wheel'``.
+
+    One "tick" of the wheel is one bucket wide. Each call is put into
+    a slot on the lowest level whose span covers its deadline; when a
+    level wraps around, the next slot from the level above is
+    "cascaded" down into the finer levels. Both inserting and
+    cancelling a call are O(1) and, no matter how many buckets are in
+    use, there is at most one underlying delayed call outstanding (for
+    the next tick that has work to do).
+
+    Cancelled calls are left in their slot and skipped once the slot
+    is reached (or cascaded); once more than half the calls in the
+    wheel are cancelled ones, every slot is compacted.
+    """
+
+    def __init__(self, *args, **kw):
+        super(_TimingWheel, self).__init__(*args, **kw)
+        self._wheels = [
+            [[] for _ in range(_WHEEL_SLOTS)]
+            for _ in range(_WHEEL_LEVELS)
+        ]
+        self._overflow = []
+        self._due = []  # calls whose tick had already passed when added
+        self._tick = 0  # the last tick we have processed
+        self._pending = 0  # number of live calls in the wheel
+        self._dead = 0  # (at most) number of cancelled calls in the wheel
+        self._delayed_call = None  # the single underlying IDelayedCall
+        self._wakeup_tick = None  # ...and the tick it is for
+        self._advancing = False
+
+    def _add_call(self, now, tick, call):
+        """
+        Internal helper. Puts a call into the wheel.
+        """
+        self._add_calls(now, tick, (call, ))
+
+    def _add_calls(self, now, tick, calls):
+        """
+        Internal helper. Puts several calls for the same tick into the
+        wheel.
+        """
+        if not self._pending and not self._advancing:
+            # the wheel is idle, so "fast-forward" it to the present
+            # instead of stepping through every tick since it was
+            # last busy.
+            self._tick = max(self._tick, self._now_tick(now) - 1)
+        self._pending += len(calls)
+        if tick <= self._tick:
+            # already due; we want to do it "right away", like the
+            # default engine does with a bucket in the past.
+            self._due.extend(calls)
+            wakeup = self._tick
+        else:
+            for call in calls:
+                wakeup = self._place(call)
+        if self._wakeup_tick is None or wakeup < self._wakeup_tick:
+            self._schedule(wakeup, now)
+
+    def _remove_call(self, tick, call):
+        """
+        Internal helper. A cancelled (or moved) call stays where it is
+        in its slot (it's skipped when the slot is reached); we only do
+        the bookkeeping.
+        """
+        self._pending -= 1
+        self._dead += 1
+        if not self._pending and self._delayed_call is not None:
+            self._delayed_call.cancel()
+            self._delayed_call = None
+            self._wakeup_tick = None
+        if self._dead > max(_COMPACT_MIN, self._pending):
+            self._compact()
+
+    def _compact(self):
+        """
+        Internal helper. Drops the cancelled (and moved) calls from
+        every slot.
+        """
+        timer_ref = self._timer_ref
+        for (level, slots) in enumerate(self._wheels):
+            shift = _WHEEL_BITS * level
+            for idx, slot in enumerate(slots):
+                if slot:
+                    slots[idx] = [
+                        c for c in slot
+                        if c._timer_ref is timer_ref and ((c._index >> shift) & _WHEEL_MASK) == idx
+                    ]
+        self._overflow = [c for c in self._overflow if c._timer_ref is timer_ref]
+        self._due = [
+            c for c in self._due
+            if c._timer_ref is timer_ref and c._index <= self._tick
+        ]
+        self._dead = 0
+
+    def _take_calls(self):
+        """
+        Internal helper. As _BatchedTimer._take_calls
+        """
+        if self._delayed_call is not None:
+            self._delayed_call.cancel()
+            self._delayed_call = None
+        self._wakeup_tick = None
+        timer_ref = self._timer_ref
+        entries = [self._due, self._overflow]
+        for slots in self._wheels:
+            entries.extend(slots)
+        calls = []
+        for slot in entries:
+            for call in slot:
+                # (a moved call may be in more than one slot, but we
+                # mark each one done as we take it)
+                if call._timer_ref is timer_ref:
+                    call._timer_ref = None
+                    calls.append(call)
+        self._wheels = [
+            [[] for _ in range(_WHEEL_SLOTS)]
+            for _ in range(_WHEEL_LEVELS)
+        ]
+        self._overflow = []
+        self._due = []
+        self._pending = 0
+        self._dead = 0
+        calls.extend(self._take_jittering())
+        return calls
+
+    def _bucket_sizes(self):
+        """
+        Internal helper. As _BatchedTimer._bucket_sizes, but we have
+        to look at every pending call to find out (so this costs
+        O(pending) time)
+        """
+        timer_ref = self._timer_ref
+        counts = {}
+        entries = [self._due, self._overflow]
+        for slots in self._wheels:
+            entries.extend(slots)
+        seen = set()
+        for slot in entries:
+            for call in slot:
+                # a moved call may be in more than one slot
+                if call._timer_ref is timer_ref and id(call) not in seen:
+                    seen.add(id(call))
+                    counts[call._index] = counts.get(call._index, 0) + 1
+        return dict(
+            (self._bucket_time(index), count)
+            for (index, count) in counts.items()
+        )
+
+    def _now_tick(self, now):
+        return _rounding['floor']((now * 1000.0) / self._bucket_milliseconds)
+
+    def _place(self, call):
+        """
+        Internal helper. Puts a call into the right slot for its tick
+        (relative to the next tick we'll process) and returns the tick
+        at which the wheel must wake up to notice it.
+        """
+        tick = call._index
+        base = self._tick + 1
+        delta = tick - base
+        for level in range(_WHEEL_LEVELS):
+            shift = _WHEEL_BITS * level
+            if delta < (_WHEEL_SLOTS << shift):
+                self._wheels[level][(tick >> shift) & _WHEEL_MASK].append(call)
+                # a call on a higher level needs attention when its
+                # slot is cascaded, at the start of its "block"
+                return max(base, (tick >> shift) << shift)
+        self._overflow.append(call)
+        # the overflow is looked at when every level wraps around
+        shift = _WHEEL_BITS * _WHEEL_LEVELS
+        return ((base >> shift) + 1) << shift
+
+    def _cascade(self, base):
+        """
+        Internal helper. Moves the calls from the slots of the higher
+        levels which are "due" at ``base`` down into the lower levels.
+        """
+        timer_ref = self._timer_ref
+        for level in range(1, _WHEEL_LEVELS):
+            if (base >> (_WHEEL_BITS * (level - 1))) & _WHEEL_MASK:
+                return  # the level below didn't wrap around
+            shift = _WHEEL_BITS * level
+            slots = self._wheels[level]
+            idx = (base >> shift) & _WHEEL_MASK
+            calls = slots[idx]
+            slots[idx] = []
+            for call in calls:
+                # (skipping calls that were moved elsewhere)
+                if call._timer_ref is timer_ref and ((call._index >> shift) & _WHEEL_MASK) == idx:
+                    self._place(call)
+        if not (base >> (_WHEEL_BITS * (_WHEEL_LEVELS - 1))) & _WHEEL_MASK:
+            calls = self._overflow
+            self._overflow = []
+            for call in calls:
+                if call._timer_ref is timer_ref:
+                    self._place(call)
+
+    def _next_wakeup(self, include_due=True):
         """
-        Internal helper. Removes a (possibly still pending) call from a
-        bucket. It is *not* an error of the bucket is gone (e.g. the
-        call has already happened).
+        Internal helper. Returns the next tick at which there might be
+        something to do (a slot to notify or cascade) or None if the
+        wheel is empty. With ``include_due`` False, calls which are
+        already due are ignored.
         """
+        if self._due and include_due:
+            return self._tick
+        base = self._tick + 1
+        wakeup = None
+        for level in range(_WHEEL_LEVELS):
+            shift = _WHEEL_BITS * level
+            slots = self._wheels[level]
+            pos = base >> shift
+            if (pos << shift) != base:
+                pos += 1  # the current slot was already cascaded
+            # each slot is "visited" once in the next _WHEEL_SLOTS
+            # positions of its level; the first non-empty one is the
+            # earliest thing this level has for us.
+            for pos in range(pos, pos + _WHEEL_SLOTS):
+                if slots[pos & _WHEEL_MASK]:
+                    if wakeup is None or (pos << shift) < wakeup:
+                        wakeup = pos << shift
+                    break
+        if self._overflow:
+            shift = _WHEEL_BITS * _WHEEL_LEVELS
+            overflow = ((base >> shift) + 1) << shift
+            if wakeup is None or overflow < wakeup:
+                wakeup = overflow
+        return wakeup
+
+    def _schedule(self, tick, now=None):
+        """
+        Internal helper. (Re-)schedules our one underlying delayed call
+        to happen at ``tick``
+        """
+        if self._advancing:
+            return  # _advance() will call us when it's done
+        if self._delayed_call is not None:
+            self._delayed_call.cancel()
+            self._delayed_call = None
+        self._wakeup_tick = tick
+        if tick is None:
+            return
+        if now is None:
+            now = self._get_seconds()
+        diff = self._bucket_time(tick) - now
+        self._delayed_call = self._create_delayed_call(
+            max(0.0, diff),
+            self._advance, tick,
+        )
+
+    def _advance(self, target):
+        """
+        Internal helper. Our underlying delayed call for ``target``
+        has happened; process every tick up to the current time.
+        """
+        self._delayed_call = None
+        self._wakeup_tick = None
+        target = max(target, self._now_tick(self._get_seconds()))
+        self._advancing = True
         try:
-            (delayed_call, calls) = self._buckets[real_time]
-        except KeyError:
-            # no such bucket ... error? swallow?
+            if self._due:
+                due = self._due
+                self._due = []
+                self._notify_live(due, self._tick)
+            while self._pending:
+                base = self._tick + 1
+                if base & _WHEEL_MASK and not self._wheels[0][base & _WHEEL_MASK]:
+                    # nothing to do in the next tick; skip straight
+                    # to the next one that has work. (Calls made due
+                    # by our callbacks meanwhile are left for the next
+                    # wakeup, as the default engine does, or we'd
+                    # never get past them)
+                    base = self._next_wakeup(include_due=False)
+                if base is None or base > target:
+                    break
+                self._tick = base - 1
+                if not base & _WHEEL_MASK:
+                    self._cascade(base)
+                self._tick = base
+                self._notify_slot(base)
+            self._tick = max(self._tick, target)
+        finally:
+            self._advancing = False
+            self._schedule(self._next_wakeup() if self._pending else None)
+
+    def _notify_slot(self, tick):
+        """
+        Internal helper. Does the (non-cancelled) calls in the lowest
+        level's slot for ``tick``
+        """
+        idx = tick & _WHEEL_MASK
+        slot = self._wheels[0][idx]
+        if not slot:
             return
-        # remove call; if we're empty, cancel underlying
-        # bucket-timeout IDelayedCall
-        calls.remove(call)
-        if not calls:
-            del self._buckets[real_time]
-            delayed_call.cancel()
+        self._wheels[0][idx] = []
+        self._notify_live(slot, tick)
+
+    def _notify_live(self, slot, tick):
+        """
+        Internal helper. Does the calls from ``slot`` which are still
+        live and due at ``tick``
+        """
+        calls = self._live_calls(slot, tick)
+        if calls:
+            self._pending -= len(calls)
+            self._notify_calls(calls, self._bucket_time(tick))
+
+
+_engines = {
+    'bucket': _BatchedTimer,
+    'wheel': _TimingWheel,
+}
+
+
+def _make_batched_timer(engine, *args, **kw):
+    """
+    Internal helper. Creates an IBatchedTimer instance of the given
+    engine type; ``args`` and ``kw`` are passed on to its constructor.
+    """
+    try:
+        timer_class = _engines[engine]
+    except KeyError:
+        raise ValueError(
+            "Unknown batched-timer engine '{}'; valid are: {}".format(
+                engine, ', '.join(sorted(_engines.keys())),
+            )
+        )
+    return timer_class(*args, **kw)
+
+
+class _CrossThreadQueue(object):
+    """
+    Internal helper. Collects things to do on an event-loop's thread
+    from any thread; the loop is woken up (by ``wakeup(callable)``,
+    e.g. ``loop.call_soon_threadsafe`` or ``reactor.callFromThread``)
+    at most once per batch, and the whole batch is done in a single
+    callback.
+    """
+
+    def __init__(self, wakeup, is_loop_thread=None):
+        self._wakeup = wakeup
+        # until we've seen the loop's thread, this callable (if any)
+        # tells us whether we're on it
+        self._is_loop_thread = is_loop_thread
+        self._lock = threading.Lock()
+        self._items = []
+        self._scheduled = False
+        # the loop's thread (once we've seen it)
+        self.loop_thread = None
+
+    def put(self, func, *args):
+        """
+        Arranges for ``func(*args)`` to be called on the loop's thread.
+        """
+        with self._lock:
+            self._items.append((func, args))
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._wakeup(self._run)
+
+    def in_loop_thread(self):
+        """
+        :returns: True if we're (known to be) on the loop's thread
+        """
+        if self.loop_thread is None and self._is_loop_thread is not None:
+            return self._is_loop_thread()
+        return threading.current_thread() is self.loop_thread
+
+    def _run(self):
+        self.loop_thread = threading.current_thread()
+        with self._lock:
+            items = self._items
+            self._items = []
+            self._scheduled = False
+        error = None
+        for (func, args) in items:
+            try:
+                func(*args)
+            except Exception:
+                # the rest of the batch must still happen
+                if error is None:
+                    error = sys.exc_info()
+        if error is not None:
+            six.reraise(*error)
+
+
+# loop -> its _CrossThreadQueue for resolve_threadsafe() etc.
+_loop_queues = weakref.WeakKeyDictionary()
+_loop_queues_lock = threading.Lock()
+
+
+def _queue_for_loop(loop, wakeup, is_loop_thread=None):
+    """
+    Internal helper.
+
+    :returns: the _CrossThreadQueue for ``loop`` (shared by all API
+        instances), created with ``wakeup`` (and ``is_loop_thread``)
+        the first time.
+    """
+    with _loop_queues_lock:
+        queue = _loop_queues.get(loop)
+        if queue is None:
+            queue = _loop_queues[loop] = _CrossThreadQueue(wakeup, is_loop_thread)
+        return queue
+
+
+class _QueuedCall(object):
+    """
+    What _ThreadsafeBatchedTimer.call_later() returns when called from
+    another thread; the real batched call is only made once the loop
+    gets to our queue. It has the same methods as the batched call's
+    handle; ``cancel()``, ``reset()`` and ``delay()`` may be called
+    from any thread (and, until the call is made, are queued after
+    it).
+    """
+
+    __slots__ = ('_queue', '_call', '_cancelled')
+
+    def __init__(self, queue):
+        self._queue = queue
+        self._call = None
+        self._cancelled = False
+
+    def _schedule(self, timer, delay, func, args, kwargs):
+        if not self._cancelled:
+            self._call = timer.call_later(delay, func, *args, **kwargs)
+
+    def _cancel(self):
+        if self._call is not None:
+            self._call.cancel()
+            self._call = None
+
+    def _reset(self, delay):
+        if self._call is not None and self._call.active():
+            self._call.reset(delay)
+
+    def _delay(self, extra):
+        if self._call is not None and self._call.active():
+            self._call.delay(extra)
+
+    def _on_loop(self, method, *args):
+        if self._call is not None and self._queue.in_loop_thread():
+            method(*args)
+        else:
+            self._queue.put(method, *args)
+
+    def cancel(self):
+        self._cancelled = True
+        self._on_loop(self._cancel)
+
+    def reset(self, delay):
+        self._on_loop(self._reset, delay)
+
+    def delay(self, extra):
+        self._on_loop(self._delay, extra)
+
+    def active(self):
+        """
+        :returns: True if this call hasn't happened (or been cancelled)
+            yet
+        """
+        if self._cancelled:
+            return False
+        return self._call is None or self._call.active()
+
+
+class _ThreadsafeBatchedTimer(object):
+    """
+    One shard of a _ShardedBatchedTimers: an IBatchedTimer for one
+    event-loop whose ``call_later`` may be called from any thread.
+    """
+
+    def __init__(self, timer, wakeup, is_loop_thread=None):
+        #: the underlying IBatchedTimer; only use it on the loop's thread
+        self.timer = timer
+        self._queue = _CrossThreadQueue(wakeup, is_loop_thread)
+
+    def call_later(self, delay, func, *args, **kwargs):
+        """
+        As :meth:`txaio.IBatchedTimer.call_later`, but may be called from
+        any thread (the returned object's ``.cancel()`` too). Calls from
+        other threads are queued up, and the loop is woken up just once
+        for each batch of them.
+        """
+        if self._queue.in_loop_thread():
+            return self.timer.call_later(delay, func, *args, **kwargs)
+        call = _QueuedCall(self._queue)
+        self._queue.put(call._schedule, self.timer, delay, func, args, kwargs)
+        return call
+
+
+class _ShardedBatchedTimers(object):
+    """
+    What ``make_sharded_batched_timer()`` returns: a batched timer per
+    event-loop (each created by ``make_shard(loop)`` when it's first
+    needed) whose ``call_later`` is thread-safe.
+    """
+
+    def __init__(self, make_shard, get_default_loop):
+        self._make_shard = make_shard
+        self._get_default_loop = get_default_loop
+        self._lock = threading.Lock()
+        # loop -> shard (a shard's timer refers to its loop, so
+        # there's no point in weak keys here)
+        self._shards = dict()
+
+    def for_loop(self, loop=None):
+        """
+        :returns: the _ThreadsafeBatchedTimer for ``loop`` (by default,
+            the configured loop)
+        """
+        if loop is None:
+            loop = self._get_default_loop()
+        with self._lock:
+            try:
+                return self._shards[loop]
+            except KeyError:
+                shard = self._shards[loop] = self._make_shard(loop)
+                return shard
+
+    def call_later(self, delay, func, *args, **kwargs):
+        """
+        Thread-safe ``call_later`` on the default loop's timer.
+        """
+        return self.for_loop().call_later(delay, func, *args, **kwargs)
+
+
+class _ConcurrentMap(object):
+    """
+    Internal helper for ``map_concurrent()`` (and ``gather(...,
+    limit=)``) on either framework: pulls items from ``iterable`` one
+    at a time, keeping at most ``limit`` calls of ``fn`` running, and
+    resolves ``future`` with their results in the same order.
+    Cancelling ``future`` stops the map, and cancels the calls still
+    running.
+
+    :param api: the txaio API instance (e.g. from with_config) to use
+    """
+
+    def __init__(self, api, fn, iterable, limit, consume_exceptions):
+        if limit < 1:
+            raise ValueError(
+                "limit must be >= 1"
+            )
+        self._api = api
+        self._fn = fn
+        self._items = iter(iterable)
+        self._limit = limit
+        self._consume = consume_exceptions
+        self._results = []
+        self._running = {}  # index -> future, for the calls not done yet
+        self._exhausted = False
+        self._filling = False
+        self._done = False
+        self.future = api.create_future()
+        api.add_callbacks(self.future, None, self._given_up)
+        self._fill()
+
+    def _fill(self):
+        if self._filling:
+            # a call finished right away, while we were starting it;
+            # the loop below carries on (instead of recursing)
+            return
+        self._filling = True
+        try:
+            while not (self._done or self._exhausted) and len(self._running) < self._limit:
+                self._start_next()
+        finally:
+            self._filling = False
+        if self._exhausted and not self._running and not self._done:
+            self._done = True
+            self._api.resolve(self.future, self._results)
+
+    def _start_next(self):
+        try:
+            item = next(self._items)
+        except StopIteration:
+            self._exhausted = True
+            return
+        except Exception:
+            self._exhausted = True
+            self._fail(self._api.create_failure())
+            return
+        index = len(self._results)
+        self._results.append(None)
+        f = self._api.as_future(self._fn, item)
+        self._running[index] = f
+        self._api.add_callbacks(
+            f,
+            partial(self._succeeded, index),
+            partial(self._failed, index),
+        )
+
+    def _succeeded(self, index, result):
+        self._results[index] = result
+        self._running.pop(index, None)
+        self._fill()
+        return result
+
+    def _failed(self, index, fail):
+        self._running.pop(index, None)
+        if self._consume:
+            self._results[index] = fail
+            self._fill()
+        else:
+            # (passed on to our future, so it's been dealt with)
+            self._fail(fail)
+        return None
+
+    def _fail(self, fail):
+        if not self._done:
+            self._done = True
+            self._api.reject(self.future, fail)
+
+    def _given_up(self, fail):
+        # e.g. future was cancelled, or timed out: no more calls are
+        # started, and the ones running are cancelled (their failures
+        # come back to _failed, which consumes them)
+        if not self._done:
+            self._done = True
+            running, self._running = self._running, {}
+            for f in running.values():
+                if not self._api.is_called(f):
+                    f.cancel()
+        return fail
+
+
+class _AsCompleted(object):
+    """
+    Internal helper for ``as_completed()`` on either framework: an
+    iterator giving one new future per item of ``futures``, which
+    are resolved (or rejected) in the order those complete.
+
+    Each completion is either handed straight to the oldest waiting
+    future or queued until one is asked for, so it costs O(1).
+
+    :param api: the txaio API instance (e.g. from with_config) to use
+    """
+
+    def __init__(self, api, futures):
+        self._api = api
+        self._ready = deque()  # (ok, result-or-failure) not yet handed out
+        self._waiting = deque()  # (future, consume) not yet resolved
+        futures = list(futures)
+        self._remaining = len(futures)
+        for f in futures:
+            api.add_callbacks(f, self._succeeded, self._failed)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self._next(False)
+    next = __next__
+
+    def _next(self, consume):
+        """
+        :returns: a future for the next outcome; if ``consume`` a
+            failure is its result, otherwise it fails the future.
+        """
+        if not self._remaining:
+            raise StopIteration()
+        self._remaining -= 1
+        future = self._api.create_future()
+        if self._ready:
+            ok, value = self._ready.popleft()
+            self._deliver(future, consume, ok, value)
+        else:
+            self._waiting.append((future, consume))
+        return future
+
+    def _deliver(self, future, consume, ok, value):
+        if ok or consume:
+            self._api.resolve(future, value)
+        else:
+            self._api.reject(future, value)
+
+    def _arrived(self, ok, value):
+        while self._waiting:
+            future, consume = self._waiting.popleft()
+            if self._api.is_called(future):
+                # given up on (e.g. cancelled); the next one asked
+                # for can have this outcome instead
+                self._remaining += 1
+                continue
+            self._deliver(future, consume, ok, value)
+            return
+        self._ready.append((ok, value))
+
+    def _succeeded(self, result):
+        self._arrived(True, result)
+        return result
+
+    def _failed(self, fail):
+        self._arrived(False, fail)
+        return None
+
+
+class _Quorum(object):
+    """
+    Internal helper for ``race()`` and ``quorum()`` on either
+    framework: resolves ``future`` as soon as ``k`` of ``futures``
+    have succeeded (or rejects it once too many have failed for that
+    to happen) and then cancels the rest of them. Cancelling
+    ``future`` cancels them all.
+
+    :param api: the txaio API instance (e.g. from with_config) to use
+
+    :param single: if True, the result is the first result itself
+        (instead of a list of the first ``k``)
+    """
+
+    def __init__(self, api, futures, k, single=False):
+        futures = list(futures)
+        if k < 1 or k > len(futures):
+            raise ValueError(
+                "need 1 <= k <= len(futures), not k={}".format(k)
+            )
+        self._api = api
+        self._futures = futures
+        self._needed = k
+        self._spare = len(futures) - k  # how many may fail
+        self._single = single
+        self._results = []
+        self._done = False
+        self.future = api.create_future()
+        for f in futures:
+            api.add_callbacks(f, self._succeeded, self._failed)
+        api.add_callbacks(self.future, None, self._given_up)
+
+    def _succeeded(self, result):
+        if not self._done:
+            self._results.append(result)
+            if len(self._results) == self._needed:
+                self._done = True
+                self._api.resolve(
+                    self.future,
+                    self._results[0] if self._single else self._results,
+                )
+                self._cancel_rest()
+        return result
+
+    def _failed(self, fail):
+        # failures are ours to deal with (including those from the
+        # cancelled losers), so we consume them
+        if not self._done:
+            if self._spare:
+                self._spare -= 1
+            else:
+                self._done = True
+                self._api.reject(self.future, fail)
+                self._cancel_rest()
+        return None
+
+    def _given_up(self, fail):
+        # e.g. future was cancelled, or timed out
+        self._done = True
+        self._cancel_rest()
+        return fail
+
+    def _cancel_rest(self):
+        futures, self._futures = self._futures, []
+        for f in futures:
+            if not self._api.is_called(f):
+                f.cancel()
+
+
+class _ThreadPool(object):
+    """
+    Internal helper for ``run_in_thread()`` on either framework: a
+    pool of at most ``max_threads`` worker threads (started as they're
+    needed). Results are handed back with ``resolve_threadsafe()``
+    and ``reject_threadsafe()``, so the loop is woken up once per
+    batch of them.
+
+    :param api: the txaio API instance (e.g. from with_config) to use
+    """
+
+    def __init__(self, api, max_threads, name='txaio-worker'):
+        if max_threads < 1:
+            raise ValueError(
+                "max_threads must be >= 1"
+            )
+        self._api = api
+        self.max_threads = max_threads
+        self._name = name
+        self._lock = threading.Condition(threading.Lock())
+        self._jobs = deque()
+        self._threads = []
+        self._idle = 0  # threads waiting for a call
+        self._busy = 0  # threads making a call
+        self._completed = 0
+        self._shutdown = False
+
+    def run_in_thread(self, fn, *args, **kwargs):
+        """
+        Calls ``fn(*args, **kwargs)`` in one of our threads.
+
+        :returns: a future of its result; cancelling it before the
+            call has started means it never will.
+        """
+        future = self._api.create_future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError(
+                    "run_in_thread() after the thread pool was shut down"
+                )
+            self._jobs.append((future, fn, args, kwargs))
+            if len(self._jobs) > self._idle and len(self._threads) < self.max_threads:
+                thread = threading.Thread(
+                    target=self._work,
+                    name='{}-{}'.format(self._name, len(self._threads)),
+                )
+                thread.daemon = True
+                self._threads.append(thread)
+                thread.start()
+            else:
+                self._lock.notify()
+        return future
+
+    def stats(self):
+        """
+        :returns: a dict with ``max_threads``, how many ``threads``
+            there are and how many of them are ``busy``, how many calls
+            are ``queued`` for a thread and how many have ``completed``.
+        """
+        with self._lock:
+            return dict(
+                max_threads=self.max_threads,
+                threads=len(self._threads),
+                busy=self._busy,
+                queued=len(self._jobs),
+                completed=self._completed,
+            )
+
+    def shutdown(self, wait=True, timeout=None):
+        """
+        Stops taking calls; those already queued still run, after which
+        the threads exit.
+
+        :param wait: if True, wait for that (for at most ``timeout``
+            seconds, if not None).
+
+        :returns: True if all the threads have exited.
+        """
+        with self._lock:
+            self._shutdown = True
+            threads = list(self._threads)
+            self._lock.notify_all()
+        if wait:
+            deadline = None if timeout is None else _wall_clock() + timeout
+            for thread in threads:
+                if thread is threading.current_thread():
+                    continue
+                thread.join(
+                    None if deadline is None else max(0, deadline - _wall_clock())
+                )
+        return not any(thread.is_alive() for thread in threads)
+
+    def _work(self):
+        ran = None  # or whether the call we took did run
+        while True:
+            with self._lock:
+                if ran is not None:
+                    self._busy -= 1
+                    self._completed += ran
+                self._idle += 1
+                while not self._jobs and not self._shutdown:
+                    self._lock.wait()
+                self._idle -= 1
+                if not self._jobs:
+                    # shut down, and there's nothing left to do
+                    self._threads.remove(threading.current_thread())
+                    return
+                future, fn, args, kwargs = self._jobs.popleft()
+                self._busy += 1
+            ran = False
+            if self._api.is_called(future):
+                # cancelled while queued
+                continue
+            ran = True
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                self._api.reject_threadsafe(future)
+            else:
+                self._api.resolve_threadsafe(future, result)
+
+
+def _run_chunk(calls):
+    """
+    Internal helper. Runs a chunk of ``(fn, args, kwargs)`` calls in a
+    worker process of a _ProcessPool, returning ``(ok, result)`` for
+    each (the exception, for a failed call) so that one failure doesn't
+    fail the rest of the chunk.
+    """
+    outcomes = []
+    for (fn, args, kwargs) in calls:
+        try:
+            outcomes.append((True, fn(*args, **kwargs)))
+        except Exception as e:
+            outcomes.append((False, e))
+    return outcomes
+
+
+class _ProcessPool(object):
+    """
+    Internal helper for ``run_in_process()`` on either framework: wraps
+    a ``concurrent.futures.ProcessPoolExecutor``, sending the calls
+    made during one trip through an event loop to the worker processes
+    in chunks (of up to ``chunk_size`` calls), to save on IPC. They're
+    split evenly over the workers, so they still run in parallel.
+    Results are handed back with ``resolve_threadsafe()`` and
+    ``reject_threadsafe()`` of the API each call was made with, so
+    one pool may be shared by several API instances (and loops).
+    """
+
+    def __init__(self, max_workers=None, chunk_size=16):
+        # python 3 (or the "futures" backport on python 2)
+        from concurrent.futures import ProcessPoolExecutor
+        if chunk_size < 1:
+            raise ValueError(
+                "chunk_size must be >= 1"
+            )
+        if max_workers is None:
+            # (what ProcessPoolExecutor does, too)
+            try:
+                max_workers = multiprocessing.cpu_count()
+            except NotImplementedError:
+                max_workers = 1
+        self._executor = ProcessPoolExecutor(max_workers)
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._pending = []  # (api, future, fn, args, kwargs) not sent yet
+        # the APIs (so loops) we've asked to flush; any of them sends
+        # all the pending calls, but each loop with calls pending must
+        # have one coming, as we can't know if the others are running
+        self._flush_scheduled = set()
+        self._running = 0
+        self._chunks = 0
+        self.shut_down = False
+
+    def run_in_process(self, api, fn, args, kwargs):
+        """
+        :returns: a future (made by ``api``) of ``fn(*args, **kwargs)``
+            run in one of our processes; ``fn``, the arguments and the
+            result must be picklable.
+        """
+        future = api.create_future()
+        chunks = None
+        with self._lock:
+            if self.shut_down:
+                raise RuntimeError(
+                    "run_in_process() after the process pool was shut down"
+                )
+            self._pending.append((api, future, fn, args, kwargs))
+            if len(self._pending) >= self.chunk_size * self.max_workers:
+                # a full chunk for each worker; no need to wait
+                chunks = self._take_pending()
+            elif api not in self._flush_scheduled:
+                self._flush_scheduled.add(api)
+                api.call_later(0, self._flush, api)
+        if chunks:
+            self._send_chunks(chunks)
+        return future
+
+    def stats(self):
+        """
+        :returns: a dict with how many calls are ``queued`` (to be sent
+            in the next chunk) or ``running`` (sent, not yet done), and
+            how many ``chunks`` have been sent.
+        """
+        with self._lock:
+            return dict(
+                queued=len(self._pending),
+                running=self._running,
+                chunks=self._chunks,
+            )
+
+    def shutdown(self, wait=True):
+        """
+        Sends any queued calls and stops taking new ones; the worker
+        processes exit once they're done (and if ``wait``, we wait for
+        that).
+        """
+        with self._lock:
+            self.shut_down = True
+            chunks = self._take_pending()
+        self._send_chunks(chunks)
+        self._executor.shutdown(wait=wait)
+
+    def _take_pending(self):
+        # (called with our lock held) returns the pending calls, split
+        # into chunks
+        calls, self._pending = self._pending, []
+        self._running += len(calls)
+        size = min(
+            self.chunk_size,
+            int(math.ceil(len(calls) / float(self.max_workers))),
+        )
+        chunks = [calls[i:i + size] for i in range(0, len(calls), size or 1)]
+        self._chunks += len(chunks)
+        return chunks
+
+    def _flush(self, api):
+        with self._lock:
+            self._flush_scheduled.discard(api)
+            chunks = self._take_pending()
+        self._send_chunks(chunks)
+
+    def _send_chunks(self, chunks):
+        for calls in chunks:
+            self._send(calls)
+
+    def _send(self, calls):
+        try:
+            done = self._executor.submit(
+                _run_chunk,
+                [(fn, args, kwargs) for (_, _, fn, args, kwargs) in calls],
+            )
+        except Exception as e:
+            self._chunk_failed(calls, e)
+        else:
+            done.add_done_callback(partial(self._chunk_done, calls))
+
+    def _chunk_done(self, calls, done):
+        # (in one of the executor's threads)
+        try:
+            outcomes = done.result()
+        except Exception as e:
+            # e.g. something wasn't picklable, or a process died
+            self._chunk_failed(calls, e)
+            return
+        with self._lock:
+            self._running -= len(calls)
+        for ((api, future, _, _, _), (ok, value)) in zip(calls, outcomes):
+            if ok:
+                api.resolve_threadsafe(future, value)
+            else:
+                api.reject_threadsafe(future, value)
+
+    def _chunk_failed(self, calls, error):
+        with self._lock:
+            self._running -= len(calls)
+        for (api, future, _, _, _) in calls:
+            api.reject_threadsafe(future, error)
+
+
+# the process pool used by all API instances (unless their config
+# has one of its own)
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def _shared_process_pool(create):
+    """
+    Internal helper.
+
+    :returns: the shared _ProcessPool, calling ``create()`` to make
+        it the first time (or after it was shut down).
+    """
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None or _process_pool.shut_down:
+            _process_pool = create()
+        return _process_pool
+
+
+def _detached_exception(exc):
+    """
+    Internal helper for compact failures.
+
+    :returns: a copy of ``exc`` without its ``__traceback__``,
+        ``__context__`` and ``__cause__`` (and so without the frames
+        they keep alive), or ``exc`` itself if it has none of those or
+        can't be copied. ``exc`` is left as it is: it may still be
+        being handled (e.g. re-raised with a bare ``raise``).
+    """
+    if getattr(exc, '__traceback__', None) is None and \
+       getattr(exc, '__context__', None) is None and \
+       getattr(exc, '__cause__', None) is None:
+        return exc
+    try:
+        return copy.copy(exc)
+    except Exception:
+        # e.g. its __init__ takes other arguments than its .args
+        return exc
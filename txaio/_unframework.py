@@ -52,20 +52,35 @@ create_future_success = _throw_usage_error
 create_future_error = _throw_usage_error
 create_failure = _throw_usage_error
 as_future = _throw_usage_error
+as_future_eager = _throw_usage_error
 is_future = _throw_usage_error
 reject = _throw_usage_error
 resolve = _throw_usage_error
+resolve_threadsafe = _throw_usage_error
+reject_threadsafe = _throw_usage_error
+run_in_thread = _throw_usage_error
+make_thread_pool = _throw_usage_error
+get_thread_pool = _throw_usage_error
+run_in_process = _throw_usage_error
+make_process_pool = _throw_usage_error
+get_process_pool = _throw_usage_error
 add_callbacks = _throw_usage_error
 gather = _throw_usage_error
+map_concurrent = _throw_usage_error
+as_completed = _throw_usage_error
+race = _throw_usage_error
+quorum = _throw_usage_error
 is_called = _throw_usage_error
 
 call_later = _throw_usage_error
+with_timeout = _throw_usage_error
 
 failure_message = _throw_usage_error
 failure_traceback = _throw_usage_error
 failure_format_traceback = _throw_usage_error
 
 make_batched_timer = _throw_usage_error
+make_sharded_batched_timer = _throw_usage_error
 
 make_logger = _throw_usage_error
 start_logging = _throw_usage_error
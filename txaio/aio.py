@@ -35,11 +35,17 @@ import traceback
 import logging
 import inspect
 
+from collections import deque
 from datetime import datetime
 
 from txaio.interfaces import IFailedFuture, ILogger, log_levels
 from txaio._iotype import guess_stream_needs_encoding
-from txaio._common import _BatchedTimer
+from txaio._common import _make_batched_timer
+from txaio._common import _ShardedBatchedTimers, _ThreadsafeBatchedTimer
+from txaio._common import _queue_for_loop, _ThreadPool
+from txaio._common import _ProcessPool, _shared_process_pool
+from txaio._common import _ConcurrentMap, _AsCompleted, _Quorum
+from txaio._common import _detached_exception
 from txaio import _Config
 
 import six
@@ -90,10 +96,248 @@ else:
     _create_future = _create_future_directly
 
 
+try:
+    from collections.abc import Coroutine as _CoroutineABC  # python 3.5+
+except ImportError:
+    _CoroutineABC = None
+
+try:
+    import contextvars  # python 3.7+
+except ImportError:
+    contextvars = None
+
+try:
+    # python 3.7+
+    from asyncio.tasks import _enter_task, _leave_task
+    from asyncio import current_task as _current_task
+except ImportError:
+    _enter_task = _leave_task = _current_task = None
+
+
+class _EagerCoroutine(object):
+    """
+    Internal helper. Wraps a coroutine which already ran until its
+    first suspension, where it yielded ``yielded`` (e.g. the Future it
+    is waiting for), so that a Task can carry on with it: the Task's
+    first step gets ``yielded`` and the rest go to the coroutine, in
+    ``context`` (its own, which the first step ran in) if not None.
+    """
+
+    __slots__ = ('_coro', '_yielded', '_context')
+
+    def __init__(self, coro, yielded, context):
+        self._coro = coro
+        self._yielded = yielded
+        self._context = context
+
+    def send(self, value):
+        yielded = self._yielded
+        if yielded is not _unspecified:
+            self._yielded = _unspecified
+            return yielded
+        if self._context is None:
+            return self._coro.send(value)
+        return self._context.run(self._coro.send, value)
+
+    def throw(self, *args):
+        yielded = self._yielded
+        if yielded is not _unspecified:
+            # (the Task was cancelled before its first step; it would
+            # have cancelled what the coroutine is waiting for)
+            self._yielded = _unspecified
+            if isinstance(yielded, Future):
+                yielded.cancel()
+        if self._context is None:
+            return self._coro.throw(*args)
+        return self._context.run(self._coro.throw, *args)
+
+    def close(self):
+        return self._coro.close()
+
+    def __await__(self):
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.send(None)
+    next = __next__
+
+
+def _leave_current_task(loop):
+    """
+    Internal helper. Makes it look as if no Task is running on
+    ``loop`` (python 3.7+), so that code run eagerly (i.e. before its
+    Task exists) can't mistake the caller's Task for its own (e.g.
+    asyncio.timeout() would cancel that one instead).
+
+    :returns: the Task to give back to _enter_task() afterwards, or
+        None
+    """
+    if _leave_task is None:
+        return None
+    task = _current_task(loop)
+    if task is not None:
+        _leave_task(loop, task)
+    return task
+
+
+def _identity(x):
+    return x
+
+
+class _CallbackChain(object):
+    """
+    Internal helper. A Deferred-like chain of (callback, errback)
+    pairs for an asyncio Future (see _AsyncioApi.add_callbacks): the
+    chain itself is the future's one done-callback, and the result
+    (or IFailedFuture) is passed along from one stage to the next.
+
+    Most futures only ever get one stage at a time, so the next one
+    to run is kept in ``callback`` and ``errback``; only the ones
+    after that go in a deque (of tuples) in ``stages``.
+
+    These are kept in _chains, which is keyed (weakly) by the future,
+    so a chain must never refer to its future.
+    """
+
+    __slots__ = ('callback', 'errback', 'stages', 'result', 'failed',
+                 'waiting', 'create_failure')
+
+    def __init__(self, create_failure, callback, errback):
+        # (that of the API instance the chain was made by)
+        self.create_failure = create_failure
+        self.callback = callback
+        self.errback = errback
+        self.stages = None
+        self.result = _unfired  # until we have the future's outcome
+        self.waiting = True  # True while something will run our stages
+
+    def add(self, callback, errback):
+        if not self.stages and self.callback is None and self.errback is None:
+            self.callback = callback
+            self.errback = errback
+        elif self.stages is None:
+            self.stages = deque([(callback, errback)])
+        else:
+            self.stages.append((callback, errback))
+
+    def __call__(self, future):
+        # our future is done (or one a stage returned, which we were
+        # waiting for); get its outcome unless we already have it
+        if self.result is _unfired:
+            try:
+                self.result = future.result()
+                self.failed = False
+            except asyncio.CancelledError:
+                # (not an Exception on python 3.8+) a Task with_timeout()
+                # cancelled fails with a TimeoutError, as a future would
+                seconds = _timed_out.get(future)
+                if seconds is None:
+                    self.result = self.create_failure()
+                else:
+                    self.result = self.create_failure(_timeout_error(seconds))
+                self.failed = True
+            except Exception:
+                self.result = self.create_failure()
+                self.failed = True
+        while True:
+            fn = self.errback if self.failed else self.callback
+            self.callback = self.errback = None
+            if fn is not None:
+                try:
+                    res = fn(self.result)
+                except Exception:
+                    self.result = self.create_failure()
+                    self.failed = True
+                else:
+                    if res.__class__ in _failure_classes:
+                        self.result = res
+                        self.failed = True
+                    elif isinstance(res, Future):
+                        # pause the chain until that future is done
+                        self.result = _unfired
+                        res.add_done_callback(self)
+                        return
+                    else:
+                        self.result = res
+                        self.failed = False
+            stages = self.stages
+            if not stages:
+                break
+            # (more may be added while a stage runs)
+            self.callback, self.errback = stages.popleft()
+        self.waiting = False
+
+
+# a _CallbackChain's result before its future is done
+_unfired = object()
+
+# future -> _CallbackChain, keyed by weak references to the futures.
+# This is what a WeakKeyDictionary does, without the cost of its
+# methods (we do a lookup for every add_callbacks call)
+_chains = dict()
+_ref = weakref.ref
+_weakref_count = weakref.getweakrefcount
+
+
+def _forget_chain(ref):
+    # (the future is gone; the ref's hash is still that of the future)
+    _chains.pop(ref, None)
+
+
+# futures which with_timeout() rejected (or Tasks it cancelled) ->
+# their timeout, in seconds
+_timed_out = weakref.WeakKeyDictionary()
+
+
+def _timeout_error(seconds):
+    return asyncio.TimeoutError("Timed out after {} seconds".format(seconds))
+
+
+try:
+    from asyncio import _get_running_loop  # python 3.5.3+
+except ImportError:
+    _get_running_loop = None
+
+
+def _is_loop_thread(loop):
+    # (for the cross-thread queues; until they've seen the loop's
+    # thread, a loop running in ours is the best we can tell)
+    if _get_running_loop is None:
+        return False
+    return _get_running_loop() is loop
+
+
+def _settle_unless_cancelled(future, settle, value):
+    # (resolve_threadsafe etc; it may have been cancelled, e.g. timed
+    # out, while that was queued)
+    if not future.cancelled():
+        settle(future, value)
+
+
+class _AsyncAsCompleted(_AsCompleted):
+    """
+    Internal helper. as_completed() for asyncio: also usable with
+    ``async for``, which gives the results themselves (or
+    IFailedFuture instances for failures).
+    """
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        try:
+            return self._next(True)
+        except StopIteration:
+            raise StopAsyncIteration()
+
+
 config = _Config()
 
 
-def with_config(loop=None):
+def with_config(loop=None, eager_coroutines=False, compact_failures=False):
     """
     :return: an instance of the txaio API with the given
         configuration. This won't affect anything using the 'gloabl'
@@ -129,10 +373,17 @@ def with_config(loop=None):
     So `fun1` will run its futures on the newly-created event loop,
     while `fun0` will work just as it did before this `with_config`
     method was introduced (after 2.6.2).
+
+    If ``eager_coroutines`` is True, :meth:`as_future` on the returned
+    instance runs coroutines eagerly (see :meth:`as_future_eager`).
+    If ``compact_failures`` is True, its :meth:`create_failure` makes
+    compact failures.
     """
     cfg = _Config()
     if loop is not None:
         cfg.loop = loop
+    cfg.eager_coroutines = eager_coroutines
+    cfg.compact_failures = compact_failures
     return _AsyncioApi(cfg)
 
 
@@ -178,6 +429,49 @@ class FailedFuture(IFailedFuture):
         return str(self.value)
 
 
+# python 3.5+; on python 2 we extract (and look up) the lines at once
+_TracebackException = getattr(traceback, 'TracebackException', None)
+
+
+class _CompactFailedFuture(IFailedFuture):
+    """
+    A FailedFuture that doesn't keep the traceback (and so every frame
+    in it, and their local variables) alive: it keeps a summary of the
+    stack (and of any chained exceptions) instead, whose source lines
+    are only looked up if it's formatted. Its ``value`` is a copy of
+    the exception without the traceback (see _detached_exception).
+    """
+
+    __slots__ = ('_type', '_value', '_traceback', '_stack')
+
+    def __init__(self, type_, value, traceback_):
+        self._type = type_
+        self._value = _detached_exception(value)
+        self._traceback = None
+        self._stack = None
+        if traceback_ is not None:
+            if _TracebackException is not None:
+                self._stack = _TracebackException(
+                    type_, value, traceback_, lookup_lines=False,
+                )
+            else:
+                self._stack = traceback.extract_tb(traceback_)
+
+    @property
+    def value(self):
+        return self._value
+
+    def __str__(self):
+        return str(self.value)
+
+
+# what create_failure() returns; a _CallbackChain stage returning one
+# of these fails the chain (isinstance() with these, as subclasses of
+# the IFailedFuture ABC, would be slow and we check every stage's
+# result)
+_failure_classes = (FailedFuture, _CompactFailedFuture)
+
+
 # logging API methods
 
 
@@ -378,6 +672,14 @@ class _AsyncioApi(object):
         returns a string
         """
         try:
+            if isinstance(fail, _CompactFailedFuture):
+                if _TracebackException is not None and fail._stack:
+                    return u''.join(fail._stack.format())
+                lines = traceback.format_exception_only(fail._type, fail.value)
+                if fail._stack:
+                    lines[:0] = ['Traceback (most recent call last):\n']
+                    lines[1:1] = traceback.format_list(fail._stack)
+                return u''.join(lines)
             f = six.StringIO()
             traceback.print_exception(
                 fail._type,
@@ -395,28 +697,57 @@ class _AsyncioApi(object):
 
         f = _create_future(loop=self._config.loop)
         if result is not _unspecified:
-            resolve(f, result)
+            self.resolve(f, result)
         elif error is not _unspecified:
-            reject(f, error)
+            self.reject(f, error)
         return f
 
+    # create_future_success() and create_future_error() are very
+    # often on hot paths (returning already-known results) so they
+    # create the future directly, without create_future()'s checks.
+
     def create_future_success(self, result):
-        return self.create_future(result=result)
+        f = _create_future(self._config.loop)
+        f.set_result(result)
+        return f
 
     def create_future_error(self, error=None):
-        f = self.create_future()
-        reject(f, error)
+        f = _create_future(self._config.loop)
+        if isinstance(error, Exception):
+            f.set_exception(error)
+        else:
+            self.reject(f, error)
         return f
 
     def as_future(self, fun, *args, **kwargs):
+        return self._as_future(fun, args, kwargs, self._config.eager_coroutines)
+
+    def as_future_eager(self, fun, *args, **kwargs):
+        """
+        Like :meth:`as_future` but if ``fun`` returns a coroutine, it is
+        run right away until it first suspends; if it finishes without
+        doing so (e.g. a cache-hit) a completed Future is returned and
+        no Task is created at all, otherwise a Task carries on from
+        where it suspended.
+
+        The code before the first suspension runs in the coroutine's
+        own context (python 3.7+) but not yet inside a Task: there,
+        ``current_task()`` is None (the caller's Task before python
+        3.7).
+        """
+        return self._as_future(fun, args, kwargs, True)
+
+    def _as_future(self, fun, args, kwargs, eager):
         try:
             res = fun(*args, **kwargs)
         except Exception:
-            return create_future_error(create_failure())
+            return self.create_future_error(self.create_failure())
         else:
             if isinstance(res, Future):
                 return res
             elif iscoroutine(res):
+                if eager:
+                    return self._run_eagerly(res)
                 return _create_task(res, loop=self._config.loop)
             elif isinstance(res, AsyncGeneratorType):
                 raise RuntimeError(
@@ -426,7 +757,36 @@ class _AsyncioApi(object):
                     )
                 )
             else:
-                return create_future_success(res)
+                return self.create_future_success(res)
+
+    def _run_eagerly(self, coro):
+        """
+        Internal helper. Runs ``coro`` until it first suspends, and
+        only then hands it to a Task.
+        """
+        if _CoroutineABC is None:
+            # we can't hand a partly-run coroutine to a Task here
+            return _create_task(coro, loop=self._config.loop)
+        loop = self._config.loop
+        context = None if contextvars is None else contextvars.copy_context()
+        caller = _leave_current_task(loop)
+        try:
+            if context is None:
+                yielded = coro.send(None)
+            else:
+                yielded = context.run(coro.send, None)
+        except StopIteration as e:
+            return self.create_future_success(e.value)
+        except asyncio.CancelledError:
+            f = _create_future(loop)
+            f.cancel()
+            return f
+        except Exception:
+            return self.create_future_error(self.create_failure())
+        finally:
+            if caller is not None:
+                _enter_task(loop, caller)
+        return _create_task(_EagerCoroutine(coro, yielded, context), loop=loop)
 
     def is_future(self, obj):
         return iscoroutine(obj) or isinstance(obj, Future)
@@ -436,7 +796,44 @@ class _AsyncioApi(object):
         real_call = functools.partial(fun, *args, **kwargs)
         return self._config.loop.call_later(delay, real_call)
 
-    def make_batched_timer(self, bucket_seconds, chunk_size=100):
+    def with_timeout(self, future, seconds, timer=None):
+        """
+        Rejects ``future`` with an ``asyncio.TimeoutError`` if it hasn't
+        completed in ``seconds``; the timeout is cancelled when it
+        does. A Task can't be rejected, so it is cancelled instead:
+        awaiting it raises ``CancelledError``, but callbacks added
+        with :meth:`add_callbacks` get the ``TimeoutError``.
+
+        Whatever was going to complete ``future`` may still call
+        :meth:`resolve` or :meth:`reject` after it timed out; that is
+        ignored (as with a cancelled Deferred).
+
+        :param timer: if not None, an :class:`txaio.IBatchedTimer` whose
+            buckets are used for the timeout (instead of a timer of
+            its own).
+
+        :returns: ``future``
+        """
+        def expire():
+            if future.done():
+                return
+            _timed_out[future] = seconds
+            if isinstance(future, asyncio.Task):
+                future.cancel()
+            else:
+                future.set_exception(_timeout_error(seconds))
+
+        if timer is None:
+            call = self._config.loop.call_later(seconds, expire)
+        else:
+            call = timer.call_later(seconds, expire)
+        future.add_done_callback(lambda _: call.cancel())
+        return future
+
+    def make_batched_timer(self, bucket_seconds, chunk_size=100,
+                           engine='bucket', rounding='floor',
+                           time_budget=None, on_error=None, max_errors=None,
+                           jitter=None, jitter_key=None):
         """
         Creates and returns an object implementing
         :class:`txaio.IBatchedTimer`.
@@ -449,61 +846,303 @@ class _AsyncioApi(object):
         :param chunk_size: when "doing" the callbacks in a particular
             bucket, this controls how many we do at once before yielding to
             the reactor.
+
+        :param engine: ``'bucket'`` (the default) uses one underlying
+            delayed call per bucket. ``'wheel'`` uses a hierarchical
+            timing-wheel driven by a single underlying delayed call, which
+            is better if there are very many buckets in use.
+
+        :param rounding: how a call's deadline is quantized to a bucket;
+            ``'floor'`` (the default) is the bucket at or before the
+            deadline, ``'ceil'`` the bucket at or after it (so calls are
+            never early) and ``'nearest'`` the closest bucket.
+
+        :param time_budget: if not None, the calls in a bucket are done
+            for up to this many seconds at a time (e.g. ``0.002``) before
+            yielding to the reactor, instead of in ``chunk_size`` chunks
+            spread over the bucket. How often the clock is checked adapts
+            to how long the calls take (but is at least every
+            ``chunk_size`` calls).
+
+        :param on_error: if not None, a callable which is given an
+            :class:`txaio.IFailedFuture` for each call that raises an
+            error, as it happens. It should not raise itself.
+
+        :param max_errors: if ``on_error`` is None, the errors from a
+            bucket's calls are raised (as a ``RuntimeError`` with a
+            ``failures`` attribute) once the bucket is done. This caps
+            how many of the failures are kept (all are counted).
+
+        :param jitter: if not None, a bucket's calls are spread over this
+            many seconds after the bucket's time, instead of all being
+            due at once. Each call's offset comes from the hash of its
+            ``jitter_key``, so it is the same each time.
+
+        :param jitter_key: a callable taking the same ``func, *args,
+            **kwargs`` as ``call_later`` and returning a (hashable) key
+            for the call. The default is the instance a bound-method
+            belongs to (so e.g. all calls for one connection share an
+            offset), or else ``func`` itself.
         """
 
         def get_seconds():
             return self._config.loop.time()
 
-        return _BatchedTimer(
-            bucket_seconds * 1000.0, chunk_size,
+        def create_future(canceller):
+            f = _create_future(loop=self._config.loop)
+
+            def done(f):
+                if f.cancelled():
+                    canceller(f)
+            f.add_done_callback(done)
+            return f
+
+        def resolve_future(f):
+            if not f.done():
+                f.set_result(None)
+
+        def reject_future(f, error):
+            if not f.done():
+                f.set_exception(error)
+
+        return _make_batched_timer(
+            engine, bucket_seconds * 1000.0, chunk_size,
             seconds_provider=get_seconds,
             delayed_call_creator=self.call_later,
+            rounding=rounding,
+            budget_milliseconds=None if time_budget is None else time_budget * 1000.0,
+            failure_creator=self.create_failure,
+            on_error=on_error,
+            max_errors=max_errors,
+            jitter_milliseconds=None if jitter is None else jitter * 1000.0,
+            jitter_key=jitter_key,
+            future_creator=create_future,
+            future_resolver=resolve_future,
+            future_rejecter=reject_future,
         )
 
+    def make_sharded_batched_timer(self, bucket_seconds, **kw):
+        """
+        Creates and returns an object with a batched timer per event
+        loop, whose ``call_later`` can be called from any thread.
+
+        ``for_loop(loop=None)`` returns the timer for ``loop`` (by
+        default, the configured one), creating it (with
+        :meth:`make_batched_timer` and the given arguments; the engine
+        defaults to ``'wheel'``) the first time. Calls from other
+        threads are queued and the loop is woken up just once per
+        batch of them. ``call_later`` on the returned object itself
+        uses the default loop's timer.
+        """
+        kw.setdefault('engine', 'wheel')
+
+        def make_shard(loop):
+            return _ThreadsafeBatchedTimer(
+                with_config(loop=loop).make_batched_timer(bucket_seconds, **kw),
+                loop.call_soon_threadsafe,
+                functools.partial(_is_loop_thread, loop),
+            )
+
+        return _ShardedBatchedTimers(make_shard, lambda: self._config.loop)
+
     def is_called(self, future):
         return future.done()
 
     def resolve(self, future, result=None):
-        future.set_result(result)
+        try:
+            future.set_result(result)
+        except asyncio.InvalidStateError:
+            # a late result for a future with_timeout() gave up on
+            if future not in _timed_out:
+                raise
 
     def reject(self, future, error=None):
         if error is None:
-            error = create_failure()  # will be error if we're not in an "except"
+            error = self.create_failure()  # will be error if we're not in an "except"
         elif isinstance(error, Exception):
             error = FailedFuture(type(error), error, None)
         else:
             if not isinstance(error, IFailedFuture):
                 raise RuntimeError("reject requires an IFailedFuture or Exception")
-        future.set_exception(error.value)
+        try:
+            future.set_exception(error.value)
+        except asyncio.InvalidStateError:
+            if future not in _timed_out:
+                raise
+
+    def resolve_threadsafe(self, future, result=None):
+        """
+        Like :meth:`resolve` but may be called from any thread: it's
+        queued, and the loop is woken up once for each batch of these
+        (which are then all done in a single callback).
+        """
+        self._settle_threadsafe(future, self.resolve, result)
+
+    def reject_threadsafe(self, future, error=None):
+        """
+        Like :meth:`reject` but may be called from any thread (see
+        :meth:`resolve_threadsafe`).
+        """
+        if error is None:
+            # the exception is only known to this thread
+            error = self.create_failure()
+        self._settle_threadsafe(future, self.reject, error)
+
+    def _settle_threadsafe(self, future, settle, value):
+        loop = getattr(future, '_loop', None) or self._config.loop
+        queue = _queue_for_loop(
+            loop, loop.call_soon_threadsafe, functools.partial(_is_loop_thread, loop),
+        )
+        if queue.in_loop_thread():
+            _settle_unless_cancelled(future, settle, value)
+        else:
+            queue.put(_settle_unless_cancelled, future, settle, value)
+
+    def run_in_thread(self, fn, *args, **kwargs):
+        """
+        Calls the (blocking) ``fn(*args, **kwargs)`` in a thread of our
+        thread pool (see :meth:`get_thread_pool`).
+
+        :returns: a Future of its result
+        """
+        return self.get_thread_pool().run_in_thread(fn, *args, **kwargs)
+
+    def make_thread_pool(self, max_threads, name='txaio-worker'):
+        """
+        :returns: a new pool of at most ``max_threads`` threads, with
+            ``run_in_thread(fn, *args, **kwargs)``, ``stats()`` and
+            ``shutdown(wait=True, timeout=None)`` methods.
+        """
+        return _ThreadPool(self, max_threads, name)
+
+    def get_thread_pool(self):
+        """
+        :returns: the thread pool from our config (``thread_pool``),
+            creating one of ``thread_pool_size`` threads if it's None.
+        """
+        pool = self._config.thread_pool
+        if pool is None:
+            pool = self._config.thread_pool = self.make_thread_pool(
+                self._config.thread_pool_size,
+            )
+        return pool
 
-    def create_failure(self, exception=None):
+    def run_in_process(self, fn, *args, **kwargs):
+        """
+        Calls the (CPU-bound) ``fn(*args, **kwargs)`` in a worker
+        process of our process pool (see :meth:`get_process_pool`);
+        ``fn``, the arguments and the result must be picklable.
+
+        :returns: a Future of its result
+        """
+        return self.get_process_pool().run_in_process(self, fn, args, kwargs)
+
+    def make_process_pool(self, max_workers=None, chunk_size=16):
+        """
+        :returns: a new pool of ``max_workers`` processes (by default,
+            one per CPU) to which calls are sent in chunks of up to
+            ``chunk_size``, with ``run_in_process(api, fn, args,
+            kwargs)``, ``stats()`` and ``shutdown(wait=True)`` methods.
+        """
+        return _ProcessPool(max_workers, chunk_size)
+
+    def get_process_pool(self):
+        """
+        :returns: the process pool from our config
+            (``process_pool``) or, if that's None, the one shared by all
+            configs, creating it (with ``process_pool_size`` processes)
+            if need be.
+        """
+        if self._config.process_pool is not None:
+            return self._config.process_pool
+        return _shared_process_pool(
+            lambda: self.make_process_pool(self._config.process_pool_size)
+        )
+
+    def create_failure(self, exception=None, compact=None):
         """
         This returns an object implementing IFailedFuture.
 
         If exception is None (the default) we MUST be called within an
         "except" block (such that sys.exc_info() returns useful
         information).
+
+        :param compact: if True, the failure keeps only a summary of
+            the traceback (see :class:`_CompactFailedFuture`); if None
+            (the default) ``compact_failures`` from our config decides.
         """
+        if compact is None:
+            compact = self._config.compact_failures
+        cls = _CompactFailedFuture if compact else FailedFuture
         if exception:
-            return FailedFuture(type(exception), exception, None)
-        return FailedFuture(*sys.exc_info())
+            return cls(type(exception), exception, None)
+        return cls(*sys.exc_info())
 
     def add_callbacks(self, future, callback, errback):
         """
         callback or errback may be None, but at least one must be
         non-None.
+
+        As with Twisted, the callbacks and errbacks added to a future
+        form a chain: each gets what the one before it returned (or
+        raised), and ``future`` is returned so calls can be chained.
         """
-        def done(f):
-            try:
-                res = f.result()
-                if callback:
-                    callback(res)
-            except Exception:
-                if errback:
-                    errback(create_failure())
-        return future.add_done_callback(done)
+        # (a future without any weak references has no chain yet, and
+        # that's cheaper to find out than looking it up)
+        chain = _chains.get(_ref(future)) if _weakref_count(future) else None
+        if chain is None:
+            chain = _CallbackChain(self.create_failure, callback, errback)
+            _chains[_ref(future, _forget_chain)] = chain
+            future.add_done_callback(chain)
+            return future
+        chain.add(callback, errback)
+        if not chain.waiting:
+            # the future is done, and the chain has run out of stages
+            # so far; carry on (soon, like a done-callback would)
+            chain.waiting = True
+            future.add_done_callback(chain)
+        return future
+
+    def map_concurrent(self, fn, iterable, limit, consume_exceptions=True):
+        """
+        Calls ``fn(item)`` (as with :meth:`as_future`) for each item of
+        ``iterable``, taking items from it only as needed to keep at
+        most ``limit`` calls running at once.
+
+        :returns: a future of a list of the results (or
+            IFailedFuture instances, if ``consume_exceptions``;
+            otherwise the first failure fails it, and no more items are
+            taken) in the same order as ``iterable``.
+        """
+        return _ConcurrentMap(self, fn, iterable, limit, consume_exceptions).future
+
+    def race(self, futures):
+        """
+        :returns: a Future of the result of whichever of ``futures``
+            succeeds first (or of the last failure, if they all fail);
+            the rest of them are then cancelled.
+        """
+        return _Quorum(self, futures, 1, single=True).future
+
+    def quorum(self, futures, k):
+        """
+        :returns: a Future of a list of the first ``k`` results (in the
+            order they arrive) from ``futures``, or of the failure after
+            which ``k`` of them can no longer succeed; the rest of them
+            are then cancelled.
+        """
+        return _Quorum(self, futures, k).future
 
-    def gather(self, futures, consume_exceptions=True):
+    def as_completed(self, futures):
+        """
+        Iterates over new Futures, one per item of ``futures``, which
+        get the outcomes of those in the order they complete; with
+        ``async for`` it gives the results themselves instead (or
+        IFailedFuture instances, for failures) as they arrive.
+        """
+        return _AsyncAsCompleted(self, futures)
+
+    def gather(self, futures, consume_exceptions=True, limit=None):
         """
         This returns a Future that waits for all the Futures in the list
         ``futures``
@@ -512,7 +1151,14 @@ class _AsyncioApi(object):
 
         :param consume_exceptions: if True, any errors are eaten and
         returned in the result list.
+
+        :param limit: if not None, ``futures`` may be any iterable (e.g.
+            a generator creating the futures or coroutines) and we take
+            items from it only as needed to keep at most ``limit`` of
+            them running at once (see :meth:`map_concurrent`).
         """
+        if limit is not None:
+            return self.map_concurrent(_identity, futures, limit, consume_exceptions)
 
         # from the asyncio docs: "If return_exceptions is True, exceptions
         # in the tasks are treated the same as successful results, and
@@ -544,13 +1190,28 @@ create_future = _default_api.create_future
 create_future_success = _default_api.create_future_success
 create_future_error = _default_api.create_future_error
 as_future = _default_api.as_future
+as_future_eager = _default_api.as_future_eager
 is_future = _default_api.is_future
 call_later = _default_api.call_later
+with_timeout = _default_api.with_timeout
 make_batched_timer = _default_api.make_batched_timer
+make_sharded_batched_timer = _default_api.make_sharded_batched_timer
 is_called = _default_api.is_called
 resolve = _default_api.resolve
 reject = _default_api.reject
+resolve_threadsafe = _default_api.resolve_threadsafe
+reject_threadsafe = _default_api.reject_threadsafe
+run_in_thread = _default_api.run_in_thread
+make_thread_pool = _default_api.make_thread_pool
+get_thread_pool = _default_api.get_thread_pool
+run_in_process = _default_api.run_in_process
+make_process_pool = _default_api.make_process_pool
+get_process_pool = _default_api.get_process_pool
 create_failure = _default_api.create_failure
 add_callbacks = _default_api.add_callbacks
 gather = _default_api.gather
+map_concurrent = _default_api.map_concurrent
+as_completed = _default_api.as_completed
+race = _default_api.race
+quorum = _default_api.quorum
 sleep = _default_api.sleep
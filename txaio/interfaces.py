@@ -74,10 +74,92 @@ class IBatchedTimer(object):
         This speaks the same API as :meth:`txaio.call_later` and also
         returns an object that has a ``.cancel`` method.
 
-        You cannot rely on any other methods/attributes of the
-        returned object. The timeout will actually fire at an
-        aribtrary time "close" to the delay specified, depening upon
-        the arguments this IBatchedTimer was created with.
+        The returned object also has ``.reset(delay)`` (to re-schedule
+        it ``delay`` seconds from now), ``.delay(extra)`` (to push it
+        ``extra`` seconds later) and ``.active()``. Re-scheduling
+        re-uses the same object, and is free if the new time is in the
+        same bucket as before. You cannot rely on any other
+        methods/attributes of the returned object. The timeout will
+        actually fire at an aribtrary time "close" to the delay
+        specified, depening upon the arguments this IBatchedTimer was
+        created with.
+        """
+
+    def call_later_many(self, entries):
+        """
+        Like calling :meth:`call_later` for each of ``entries``, but
+        cheaper: the clock is only read once and each bucket is only
+        looked up (or created) once.
+
+        :param entries: an iterable of tuples of ``(delay, func)``,
+            ``(delay, func, args)`` or ``(delay, func, args, kwargs)``
+
+        :returns: a list of the same objects :meth:`call_later` returns,
+            in the same order as ``entries``
+        """
+
+    def call_every(self, interval, func, *args, **kw):
+        """
+        Calls ``func(*args, **kw)`` every ``interval`` seconds (the first
+        time is ``interval`` seconds from now) using this timer's
+        buckets, until the returned object's ``.cancel()`` is called.
+
+        Each call is scheduled relative to when the periodic call was
+        started (not to when the previous call happened) so there's no
+        drift. If the event loop was too busy and times were missed,
+        they are skipped rather than "caught up" on.
+        """
+
+    def sleep(self, delay):
+        """
+        Like :meth:`txaio.sleep` but the returned future (a Deferred or
+        an asyncio Future) is resolved (with None) when the bucket
+        ``delay`` seconds from now is done, so many sleepers share the
+        underlying timer (and on asyncio no Task is created).
+        Cancelling the future cancels the underlying call.
+        """
+
+    def cancel_all(self):
+        """
+        Cancels every pending call (including periodic calls and
+        sleeps, whose futures are then never resolved), cancelling
+        each underlying delayed call just once.
+        """
+
+    def drain(self):
+        """
+        Does every pending call right away (instead of waiting for its
+        bucket) in time-budgeted chunks, yielding to the event loop
+        between chunks. Errors are given to ``on_error``, if the
+        timer has one; otherwise they fail the returned future (with
+        the same ``RuntimeError`` a bucket would raise). This never
+        raises them itself.
+
+        :returns: a future which is resolved (with None) once all the
+            calls are done.
+        """
+
+    def stats(self):
+        """
+        Returns a dict describing what this timer is doing, for
+        debugging and monitoring. The keys are:
+
+        - ``buckets``: how many buckets have pending calls;
+        - ``pending``: how many calls are pending in total;
+        - ``bucket_sizes``: a dict mapping the time of each bucket (in
+          the same seconds as the reactor/loop time) to how many calls
+          are pending in it;
+        - ``scheduled``, ``fired``, ``cancelled``: how many calls have
+          been scheduled, done and cancelled (ever);
+        - ``lateness``: a list of ``(upper_bound, count)`` tuples; a
+          histogram of how late (in seconds) calls were done, relative
+          to the time of their bucket (the last bound is infinity);
+        - ``chunks``, ``chunk_seconds``, ``chunk_seconds_max``: how
+          many chunks of calls have been done and the total and
+          greatest (wall-clock) time they took.
+
+        Counting the pending calls may cost O(pending) time with some
+        engines, so don't call this too often.
         """
 
 
@@ -175,6 +257,8 @@ class IFailedFuture(object):
     incompatibilities between asyncio and Twisted.
     """
 
+    __slots__ = ()
+
     @abc.abstractproperty
     def value(self):
         """
@@ -33,17 +33,23 @@ import inspect
 
 from functools import partial
 
+from twisted.python import threadable
 from twisted.python.failure import Failure
 from twisted.internet.defer import maybeDeferred, Deferred, DeferredList
-from twisted.internet.defer import succeed, fail
-from twisted.internet.interfaces import IReactorTime
+from twisted.internet.defer import succeed, fail, TimeoutError, CancelledError
+from twisted.internet.interfaces import IReactorTime, IReactorCore
 
 from zope.interface import provider
 
 from txaio.interfaces import IFailedFuture, ILogger, log_levels
 from txaio._iotype import guess_stream_needs_encoding
 from txaio import _Config
-from txaio._common import _BatchedTimer
+from txaio._common import _make_batched_timer
+from txaio._common import _ShardedBatchedTimers, _ThreadsafeBatchedTimer
+from txaio._common import _queue_for_loop, _ThreadPool
+from txaio._common import _ProcessPool, _shared_process_pool
+from txaio._common import _ConcurrentMap, _AsCompleted, _Quorum
+from txaio._common import _detached_exception
 
 import six
 
@@ -130,7 +136,8 @@ def add_log_categories(categories):
     _categories.update(categories)
 
 
-def with_config(loop=None):
+def with_config(loop=None, eager_coroutines=False, compact_failures=False):
+    # (eager_coroutines is for asyncio; Deferreds already run eagerly)
     global config
     if loop is not None:
         if config.loop is not None and config.loop is not loop:
@@ -139,7 +146,9 @@ def with_config(loop=None):
                 "a reactor different from the one already configured "
                 "in txaio.config.loop"
             )
-    return _TxApi(config)
+    # the config is global here, so compact_failures is kept by the
+    # returned instance itself
+    return _TxApi(config, compact_failures=compact_failures)
 
 
 # NOTE: beware that twisted.logger._logger.Logger copies itself via an
@@ -359,10 +368,15 @@ def start_logging(out=_stdout, level='info'):
 _unspecified = object()
 
 
+def _identity(x):
+    return x
+
+
 class _TxApi(object):
 
-    def __init__(self, config):
+    def __init__(self, config, compact_failures=None):
         self._config = config
+        self._compact_failures = compact_failures
 
     def failure_message(self, fail):
         """
@@ -402,27 +416,73 @@ class _TxApi(object):
 
         f = Deferred()
         if result is not _unspecified:
-            resolve(f, result)
+            self.resolve(f, result)
         elif error is not _unspecified:
-            reject(f, error)
+            self.reject(f, error)
         return f
 
     def create_future_success(self, result):
         return succeed(result)
 
     def create_future_error(self, error=None):
-        return fail(create_failure(error))
+        return fail(self.create_failure(error))
 
     def as_future(self, fun, *args, **kwargs):
         return maybeDeferred(fun, *args, **kwargs)
 
+    def as_future_eager(self, fun, *args, **kwargs):
+        # this is what as_future already does with Twisted
+        return maybeDeferred(fun, *args, **kwargs)
+
     def is_future(self, obj):
         return isinstance(obj, Deferred)
 
     def call_later(self, delay, fun, *args, **kwargs):
         return IReactorTime(self._get_loop()).callLater(delay, fun, *args, **kwargs)
 
-    def make_batched_timer(self, bucket_seconds, chunk_size=100):
+    def with_timeout(self, future, seconds, timer=None):
+        """
+        Cancels the Deferred ``future`` if it hasn't fired in
+        ``seconds``, turning the resulting ``CancelledError`` into a
+        ``twisted.internet.defer.TimeoutError`` (as
+        ``Deferred.addTimeout`` does), so whatever was going to fire
+        it may still do so (which is then ignored); the timeout is
+        cancelled when it does fire.
+
+        :param timer: if not None, an :class:`txaio.IBatchedTimer` whose
+            buckets are used for the timeout (instead of a timer of
+            its own).
+
+        :returns: ``future``
+        """
+        timed_out = []
+
+        def expire():
+            if not future.called:
+                timed_out.append(True)
+                future.cancel()
+
+        if timer is None:
+            call = self.call_later(seconds, expire)
+        else:
+            call = timer.call_later(seconds, expire)
+
+        def cancel_timeout(result):
+            if timed_out:
+                if isinstance(result, Failure) and result.check(CancelledError):
+                    return Failure(
+                        TimeoutError("Timed out after {} seconds".format(seconds))
+                    )
+            elif call.active():
+                call.cancel()
+            return result
+        future.addBoth(cancel_timeout)
+        return future
+
+    def make_batched_timer(self, bucket_seconds, chunk_size=100,
+                           engine='bucket', rounding='floor',
+                           time_budget=None, on_error=None, max_errors=None,
+                           jitter=None, jitter_key=None):
         """
         Creates and returns an object implementing
         :class:`txaio.IBatchedTimer`.
@@ -435,6 +495,43 @@ class _TxApi(object):
         :param chunk_size: when "doing" the callbacks in a particular
             bucket, this controls how many we do at once before yielding to
             the reactor.
+
+        :param engine: ``'bucket'`` (the default) uses one underlying
+            delayed call per bucket. ``'wheel'`` uses a hierarchical
+            timing-wheel driven by a single underlying delayed call, which
+            is better if there are very many buckets in use.
+
+        :param rounding: how a call's deadline is quantized to a bucket;
+            ``'floor'`` (the default) is the bucket at or before the
+            deadline, ``'ceil'`` the bucket at or after it (so calls are
+            never early) and ``'nearest'`` the closest bucket.
+
+        :param time_budget: if not None, the calls in a bucket are done
+            for up to this many seconds at a time (e.g. ``0.002``) before
+            yielding to the reactor, instead of in ``chunk_size`` chunks
+            spread over the bucket. How often the clock is checked adapts
+            to how long the calls take (but is at least every
+            ``chunk_size`` calls).
+
+        :param on_error: if not None, a callable which is given an
+            :class:`txaio.IFailedFuture` for each call that raises an
+            error, as it happens. It should not raise itself.
+
+        :param max_errors: if ``on_error`` is None, the errors from a
+            bucket's calls are raised (as a ``RuntimeError`` with a
+            ``failures`` attribute) once the bucket is done. This caps
+            how many of the failures are kept (all are counted).
+
+        :param jitter: if not None, a bucket's calls are spread over this
+            many seconds after the bucket's time, instead of all being
+            due at once. Each call's offset comes from the hash of its
+            ``jitter_key``, so it is the same each time.
+
+        :param jitter_key: a callable taking the same ``func, *args,
+            **kwargs`` as ``call_later`` and returning a (hashable) key
+            for the call. The default is the instance a bound-method
+            belongs to (so e.g. all calls for one connection share an
+            offset), or else ``func`` itself.
         """
 
         def get_seconds():
@@ -443,12 +540,54 @@ class _TxApi(object):
         def create_delayed_call(delay, fun, *args, **kwargs):
             return self._get_loop().callLater(delay, fun, *args, **kwargs)
 
-        return _BatchedTimer(
-            bucket_seconds * 1000.0, chunk_size,
+        def resolve_future(d):
+            if not d.called:
+                d.callback(None)
+
+        def reject_future(d, error):
+            if not d.called:
+                d.errback(error)
+
+        return _make_batched_timer(
+            engine, bucket_seconds * 1000.0, chunk_size,
             seconds_provider=get_seconds,
             delayed_call_creator=create_delayed_call,
+            rounding=rounding,
+            budget_milliseconds=None if time_budget is None else time_budget * 1000.0,
+            failure_creator=self.create_failure,
+            on_error=on_error,
+            max_errors=max_errors,
+            jitter_milliseconds=None if jitter is None else jitter * 1000.0,
+            jitter_key=jitter_key,
+            future_creator=Deferred,
+            future_resolver=resolve_future,
+            future_rejecter=reject_future,
         )
 
+    def make_sharded_batched_timer(self, bucket_seconds, **kw):
+        """
+        Creates and returns an object with a batched timer per event
+        loop, whose ``call_later`` can be called from any thread.
+
+        ``for_loop(loop=None)`` returns the timer for ``loop`` (by
+        default, the configured one), creating it (with
+        :meth:`make_batched_timer` and the given arguments; the engine
+        defaults to ``'wheel'``) the first time. Calls from other
+        threads are queued and the loop is woken up just once per
+        batch of them. ``call_later`` on the returned object itself
+        uses the default loop's timer.
+        """
+        kw.setdefault('engine', 'wheel')
+
+        def make_shard(loop):
+            return _ThreadsafeBatchedTimer(
+                self.make_batched_timer(bucket_seconds, **kw),
+                loop.callFromThread,
+                threadable.isInIOThread,
+            )
+
+        return _ShardedBatchedTimers(make_shard, self._get_loop)
+
     def is_called(self, future):
         return future.called
 
@@ -465,17 +604,139 @@ class _TxApi(object):
                 raise RuntimeError("reject requires a Failure or Exception")
         future.errback(error)
 
-    def create_failure(self, exception=None):
+    def resolve_threadsafe(self, future, result=None):
+        """
+        Like :meth:`resolve` but may be called from any thread: it's
+        queued, and the reactor is woken up once for each batch of
+        these (which are then all done in a single callback).
+        """
+        self._settle_threadsafe(self.resolve, future, result)
+
+    def reject_threadsafe(self, future, error=None):
+        """
+        Like :meth:`reject` but may be called from any thread (see
+        :meth:`resolve_threadsafe`).
+        """
+        if error is None:
+            # the exception is only known to this thread
+            error = self.create_failure()
+        self._settle_threadsafe(self.reject, future, error)
+
+    def _settle_threadsafe(self, settle, future, value):
+        # (a cancelled Deferred ignores being called back once, so we
+        # needn't check for that)
+        loop = self._get_loop()
+        queue = _queue_for_loop(loop, loop.callFromThread, threadable.isInIOThread)
+        if queue.in_loop_thread():
+            settle(future, value)
+        else:
+            queue.put(settle, future, value)
+
+    def run_in_thread(self, fn, *args, **kwargs):
+        """
+        Calls the (blocking) ``fn(*args, **kwargs)`` in a thread of our
+        thread pool (see :meth:`get_thread_pool`).
+
+        :returns: a Deferred of its result
+        """
+        return self.get_thread_pool().run_in_thread(fn, *args, **kwargs)
+
+    def make_thread_pool(self, max_threads, name='txaio-worker'):
+        """
+        :returns: a new pool of at most ``max_threads`` threads, with
+            ``run_in_thread(fn, *args, **kwargs)``, ``stats()`` and
+            ``shutdown(wait=True, timeout=None)`` methods.
+        """
+        return _ThreadPool(self, max_threads, name)
+
+    def get_thread_pool(self):
+        """
+        :returns: the thread pool from our config (``thread_pool``),
+            creating one of ``thread_pool_size`` threads if it's None.
+            It's shut down (once its queued calls are done) before
+            the reactor is.
+        """
+        pool = self._config.thread_pool
+        if pool is None:
+            pool = self._config.thread_pool = self.make_thread_pool(
+                self._config.thread_pool_size,
+            )
+            reactor = IReactorCore(self._get_loop(), None)
+            if reactor is not None:
+                reactor.addSystemEventTrigger('before', 'shutdown', pool.shutdown)
+        return pool
+
+    def run_in_process(self, fn, *args, **kwargs):
+        """
+        Calls the (CPU-bound) ``fn(*args, **kwargs)`` in a worker
+        process of our process pool (see :meth:`get_process_pool`);
+        ``fn``, the arguments and the result must be picklable.
+
+        :returns: a Deferred of its result
+        """
+        return self.get_process_pool().run_in_process(self, fn, args, kwargs)
+
+    def make_process_pool(self, max_workers=None, chunk_size=16):
+        """
+        :returns: a new pool of ``max_workers`` processes (by default,
+            one per CPU) to which calls are sent in chunks of up to
+            ``chunk_size``, with ``run_in_process(api, fn, args,
+            kwargs)``, ``stats()`` and ``shutdown(wait=True)`` methods.
+        """
+        return _ProcessPool(max_workers, chunk_size)
+
+    def get_process_pool(self):
+        """
+        :returns: the process pool from our config
+            (``process_pool``) or, if that's None, the one shared by all
+            configs, creating it (with ``process_pool_size`` processes)
+            if need be. The shared one is shut down before the reactor
+            is.
+        """
+        if self._config.process_pool is not None:
+            return self._config.process_pool
+
+        def create():
+            pool = self.make_process_pool(self._config.process_pool_size)
+            reactor = IReactorCore(self._get_loop(), None)
+            if reactor is not None:
+                reactor.addSystemEventTrigger('before', 'shutdown', pool.shutdown)
+            return pool
+        return _shared_process_pool(create)
+
+    def create_failure(self, exception=None, compact=None):
         """
         Create a Failure instance.
 
         if ``exception`` is None (the default), we MUST be inside an
         "except" block. This encapsulates the exception into an object
         that implements IFailedFuture
+
+        :param compact: if True, the Failure is "cleaned" so it keeps
+            only a summary of the traceback; if None (the default)
+            ``compact_failures`` from our config decides.
         """
         if exception:
-            return Failure(exception)
-        return Failure()
+            fail = Failure(exception)
+        else:
+            fail = Failure()
+        if compact is None:
+            compact = self._compact_failures
+            if compact is None:
+                compact = self._config.compact_failures
+        if compact:
+            # swaps the traceback (and frames) for their string
+            # versions. This also clears the exception's __traceback__,
+            # but the exception may still be being handled (e.g. to be
+            # re-raised), so the Failure gets a copy of it instead
+            value = fail.value
+            tb = getattr(value, '__traceback__', None)
+            fail.value = _detached_exception(value)
+            fail.cleanFailure()
+            if fail.value is value and tb is not None:
+                # (it couldn't be copied) leave it as it was
+                value.__traceback__ = tb
+        return fail
 
     def add_callbacks(self, future, callback, errback):
         """
@@ -491,7 +752,55 @@ class _TxApi(object):
             future.addCallbacks(callback, errback)
         return future
 
-    def gather(self, futures, consume_exceptions=True):
+    def map_concurrent(self, fn, iterable, limit, consume_exceptions=True):
+        """
+        Calls ``fn(item)`` (as with :meth:`as_future`) for each item of
+        ``iterable``, taking items from it only as needed to keep at
+        most ``limit`` calls running at once.
+
+        :returns: a future of a list of the results (or
+            IFailedFuture instances, if ``consume_exceptions``;
+            otherwise the first failure fails it, and no more items are
+            taken) in the same order as ``iterable``.
+        """
+        return _ConcurrentMap(self, fn, iterable, limit, consume_exceptions).future
+
+    def race(self, futures):
+        """
+        :returns: a Deferred of the result of whichever of ``futures``
+            succeeds first (or of the last Failure, if they all fail);
+            the rest of them are then cancelled.
+        """
+        return _Quorum(self, futures, 1, single=True).future
+
+    def quorum(self, futures, k):
+        """
+        :returns: a Deferred of a list of the first ``k`` results (in
+            the order they arrive) from ``futures``, or of the Failure
+            after which ``k`` of them can no longer succeed; the rest of
+            them are then cancelled.
+        """
+        return _Quorum(self, futures, k).future
+
+    def as_completed(self, futures):
+        """
+        Iterates over new Deferreds, one per item of ``futures``, which
+        get the outcomes of those in the order they complete (so the
+        first one fires with whichever result arrives first, or
+        errbacks with its Failure).
+        """
+        return _AsCompleted(self, futures)
+
+    def gather(self, futures, consume_exceptions=True, limit=None):
+        """
+        :param limit: if not None, ``futures`` may be any iterable (e.g.
+            a generator creating the Deferreds) and we take items from
+            it only as needed to have at most ``limit`` of them running
+            at once (see :meth:`map_concurrent`).
+        """
+        if limit is not None:
+            return self.map_concurrent(_identity, futures, limit, consume_exceptions)
+
         def completed(res):
             rtn = []
             for (ok, value) in res:
@@ -561,13 +870,28 @@ create_future = _default_api.create_future
 create_future_success = _default_api.create_future_success
 create_future_error = _default_api.create_future_error
 as_future = _default_api.as_future
+as_future_eager = _default_api.as_future_eager
 is_future = _default_api.is_future
 call_later = _default_api.call_later
+with_timeout = _default_api.with_timeout
 make_batched_timer = _default_api.make_batched_timer
+make_sharded_batched_timer = _default_api.make_sharded_batched_timer
 is_called = _default_api.is_called
 resolve = _default_api.resolve
 reject = _default_api.reject
+resolve_threadsafe = _default_api.resolve_threadsafe
+reject_threadsafe = _default_api.reject_threadsafe
+run_in_thread = _default_api.run_in_thread
+make_thread_pool = _default_api.make_thread_pool
+get_thread_pool = _default_api.get_thread_pool
+run_in_process = _default_api.run_in_process
+make_process_pool = _default_api.make_process_pool
+get_process_pool = _default_api.get_process_pool
 create_failure = _default_api.create_failure
 add_callbacks = _default_api.add_callbacks
 gather = _default_api.gather
+map_concurrent = _default_api.map_concurrent
+as_completed = _default_api.as_completed
+race = _default_api.race
+quorum = _default_api.quorum
 sleep = _default_api.sleep